@@ -0,0 +1,65 @@
+#Benchmark of frame discovery in Sonar._decode against the original per-frame walk
+#Usage: python benchmarks/bench_decode.py [--pings 50000]
+
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from sonarlight.sonar_class import sl2_frame_dtype, sl3_frame_dtype, _frame_offsets, _frame_headers
+from synthetic import write_synthetic
+
+def legacy_decode(buffer, frame_dtype):
+    '''Original frame walk slicing and joining every frame header'''
+    position = 0
+    frame_header_list = []
+    frame_header_size = frame_dtype.itemsize
+    frame_size_slice = slice(8, 10) if frame_dtype is sl3_frame_dtype else slice(28, 30)
+
+    while (position < len(buffer)):
+        frame_head = buffer[position:(position+frame_header_size)]
+        frame_size = int.from_bytes(frame_head[frame_size_slice], "little", signed = False)
+        position += frame_size
+        if(position < len(buffer)):
+            frame_header_list.append(frame_head)
+
+    return(np.frombuffer(b''.join(frame_header_list), dtype=frame_dtype))
+
+def decode(buffer, frame_dtype):
+    offsets = _frame_offsets(buffer, frame_dtype.itemsize, frame_dtype.fields["frame_size"][1])
+    return(_frame_headers(buffer, offsets, frame_dtype))
+
+def best_time(fun, *args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fun(*args)
+        times.append(time.perf_counter() - start)
+    return(min(times), result)
+
+def bench(path):
+    frame_dtype = sl3_frame_dtype if path.endswith("sl3") else sl2_frame_dtype
+    with open(path, "rb") as f:
+        buffer = f.read()[8:]
+
+    legacy_time, legacy_headers = best_time(legacy_decode, buffer, frame_dtype)
+    new_time, new_headers = best_time(decode, buffer, frame_dtype)
+    assert np.array_equal(legacy_headers.view("uint8"), new_headers.view("uint8"))
+
+    print(f"{os.path.basename(path)}: {len(new_headers)} frames, {len(buffer)/1e6:.1f} MB - "
+          f"legacy {legacy_time*1000:.1f} ms, new {new_time*1000:.1f} ms, speedup {legacy_time/new_time:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pings", type=int, default=50000, help="Pings per channel in the synthetic files")
+    args = parser.parse_args()
+
+    for path in ["example_files/example_sl2_file.sl2", "example_files/example_sl3_file.sl3"]:
+        if os.path.exists(path):
+            bench(path)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for extension in ["sl2", "sl3"]:
+            path = os.path.join(tmp, f"synthetic.{extension}")
+            write_synthetic(path, pings=args.pings, ping_lengths={"primary": 256, "secondary": 256, "downscan": 128, "sidescan": 512})
+            bench(path)
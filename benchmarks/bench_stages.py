@@ -0,0 +1,156 @@
+#Benchmark of wall time and peak memory of each stage of reading and extracting data from synthetic files
+#Usage: python benchmarks/bench_stages.py [--size-mb 100 400] [--output report.json] [--baseline old_report.json]
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import sonarlight
+from sonarlight import Sonar
+from synthetic import write_synthetic, pings_for_size
+
+#Synthetic file configurations, sizes are set from the command line
+cases = [
+    {"name": "sl2_all_channels", "extension": "sl2", "channels": ["primary", "secondary", "downscan", "sidescan"], "ping_lengths": None},
+    {"name": "sl3_all_channels", "extension": "sl3", "channels": ["primary", "secondary", "downscan", "sidescan"], "ping_lengths": None},
+    {"name": "sl2_ragged_pings", "extension": "sl2", "channels": ["primary", "sidescan"], "ping_lengths": {"primary": (2000, 3072), "sidescan": (2000, 2800)}},
+]
+
+def stages(path: str, augment_coords: bool = True):
+    '''Stages of reading a file and extracting data as (name, function) pairs, run in order on the same Sonar object'''
+
+    sonar = Sonar.__new__(Sonar)
+    sonar._setup(path, clean=True, augment_coords=augment_coords, mmap=False)
+
+    def build_rest():
+        #Remaining steps of Sonar._build after processing and augmentation
+        sonar._select_channels()
+        sonar._clean()
+        sonar._store_echoes()
+        sonar._describe()
+
+    def images():
+        #Pings of different lengths cannot be viewed as an image, so only the pixels are gathered
+        for channel in sonar.valid_channels:
+            if sonar.echoes[channel].uniform:
+                sonar.image(channel)
+            else:
+                sonar.echoes[channel].values
+
+    return([
+        ("read_bin", sonar._read_bin),
+        ("parse_header", sonar._parse_header),
+        ("decode", sonar._decode),
+        ("process", sonar._process),
+        ("coordinate_augmentation", sonar._coordinate_augmentation if augment_coords else lambda: None),
+        ("clean_and_store", build_rest),
+        ("image", images),
+        ("water", lambda: sonar.water("primary", 300)),
+        ("bottom", lambda: sonar.bottom("primary")),
+        ("sidescan_xyz", sonar.sidescan_xyz),
+    ])
+
+def run_case(path: str, repeat: int) -> dict:
+    file_bytes = os.path.getsize(path)
+    results = {}
+
+    #Wall time is the best of the repeated runs, measured without tracing allocations
+    for _ in range(repeat):
+        for name, fun in stages(path):
+            start = time.perf_counter()
+            fun()
+            seconds = time.perf_counter() - start
+            results[name] = min(results.get(name, seconds), seconds)
+
+    #Peak allocation is measured in a separate run with tracemalloc, which also traces NumPy allocations
+    peaks = {}
+    tracemalloc.start()
+    for name, fun in stages(path):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        fun()
+        peaks[name] = tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+
+    report = {}
+    for name, seconds in results.items():
+        report[name] = {"seconds": seconds,
+                        "mb_per_second": file_bytes / 1e6 / seconds if seconds > 0 else None,
+                        "peak_bytes": peaks[name],
+                        "peak_bytes_per_gb": peaks[name] / (file_bytes / 1e9)}
+    report["total"] = {"seconds": sum(i["seconds"] for i in report.values()),
+                       "peak_bytes": max(i["peak_bytes"] for i in report.values())}
+    report["total"]["mb_per_second"] = file_bytes / 1e6 / report["total"]["seconds"]
+    report["total"]["peak_bytes_per_gb"] = report["total"]["peak_bytes"] / (file_bytes / 1e9)
+
+    return(report)
+
+def compare(report: dict, baseline: dict, tolerance: float, min_seconds: float = 0.01, min_bytes: int = 2**20) -> list:
+    '''Stages that are slower or use more memory than in the baseline report by more than "tolerance" (fraction).
+    Stages faster than "min_seconds" or allocating less than "min_bytes" are not compared to avoid noise'''
+
+    baseline_cases = {(i["name"], i["size_mb"]): i for i in baseline["cases"]}
+    regressions = []
+
+    for case in report["cases"]:
+        old_case = baseline_cases.get((case["name"], case["size_mb"]))
+        if old_case is None:
+            continue
+        for stage, new in case["stages"].items():
+            old = old_case["stages"].get(stage)
+            if old is None:
+                continue
+            if new["seconds"] > max(old["seconds"], min_seconds) * (1 + tolerance):
+                regressions.append(f'{case["name"]} {case["size_mb"]} MB {stage}: {old["seconds"]:.3f} s -> {new["seconds"]:.3f} s')
+            if new["peak_bytes_per_gb"] > max(old["peak_bytes_per_gb"], min_bytes / (case["file_bytes"] / 1e9)) * (1 + tolerance):
+                regressions.append(f'{case["name"]} {case["size_mb"]} MB {stage}: {old["peak_bytes_per_gb"]/2**20:.0f} MB/GB -> {new["peak_bytes_per_gb"]/2**20:.0f} MB/GB peak memory')
+
+    return(regressions)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=float, nargs="+", default=[100], help="Sizes of the synthetic files in MB")
+    parser.add_argument("--cases", nargs="+", default=[i["name"] for i in cases], help="Names of the file configurations to run")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage, the best wall time is reported")
+    parser.add_argument("--output", default="benchmark_report.json", help="Path of the JSON report")
+    parser.add_argument("--baseline", default=None, help="Report of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative increase in time and peak memory compared to the baseline")
+    args = parser.parse_args()
+
+    report = {"sonarlight": sonarlight.__version__, "python": sys.version.split()[0], "numpy": np.__version__,
+              "pandas": pd.__version__, "platform": platform.platform(), "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "cases": []}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for case in [i for i in cases if i["name"] in args.cases]:
+            for size_mb in args.size_mb:
+                kwargs = {} if case["ping_lengths"] is None else {"ping_lengths": case["ping_lengths"]}
+                path = os.path.join(tmp, f'{case["name"]}.{case["extension"]}')
+                pings = pings_for_size(size_mb * 1e6, case["extension"], case["channels"], **kwargs)
+                file_bytes = write_synthetic(path, pings=pings, channels=case["channels"], **kwargs)
+
+                case_report = run_case(path, args.repeat)
+                report["cases"].append({"name": case["name"], "size_mb": size_mb, "file_bytes": file_bytes,
+                                        "pings": pings, "stages": case_report})
+                os.remove(path)
+
+                print(f'{case["name"]} ({file_bytes/1e6:.0f} MB)')
+                for stage, result in case_report.items():
+                    print(f'  {stage:<24} {result["seconds"]*1000:10.1f} ms {result["peak_bytes"]/2**20:10.1f} MB peak')
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for i in regressions:
+            print(f"Regression: {i}")
+        sys.exit(1 if regressions else 0)
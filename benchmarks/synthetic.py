@@ -0,0 +1,100 @@
+#Generator of synthetic '.sl2' and '.sl3' files for benchmarking
+
+import numpy as np
+import math
+from sonarlight.sonar_class import sl2_frame_dtype, sl3_frame_dtype
+
+survey_types = {"primary": 0, "secondary": 1, "downscan": 2, "sidescan": 5}
+
+default_ping_lengths = {"primary": 3072, "secondary": 3072, "downscan": 1400, "sidescan": 2800}
+
+def write_synthetic(path: str, pings: int = 1000, channels: list = ["primary", "secondary", "downscan", "sidescan"],
+                    ping_lengths: dict = default_ping_lengths, seed: int = 0, chunk_pings: int = 1000) -> int:
+    '''
+    Write a synthetic '.sl2' or '.sl3' file (decided by the file extension) and return the file size in bytes.
+
+    Arguments:
+    pings - Number of pings for each channel. Frames of the channels are interleaved in the order given by "channels".
+    ping_lengths - Number of pixels per ping for each channel, either an integer or a (min, max) tuple for pings of varying length.
+    chunk_pings - Number of pings generated at a time to bound memory use for large files.
+    '''
+
+    frame_dtype = sl3_frame_dtype if path.endswith("sl3") else sl2_frame_dtype
+    frame_header_size = frame_dtype.itemsize
+    rng = np.random.default_rng(seed)
+
+    lon0, lat0 = 9.5, 56.0
+    x0 = lon0 * (math.pi / 180) * 6356752.3142
+    y0 = math.log(math.tan((lat0 * (math.pi / 180) + (math.pi / 2)) / 2)) * 6356752.3142
+    heading = 1.2
+    speed = 1.5 #m/s
+
+    n_channels = len(channels)
+    channel_survey = np.array([survey_types[c] for c in channels])
+    position = 8
+    prev_frame_size = 0
+
+    with open(path, "wb") as f:
+        f.write(np.array([3 if frame_dtype is sl3_frame_dtype else 2, 2, 3200, 0], dtype="<i2").tobytes())
+
+        for chunk_start in range(0, pings, chunk_pings):
+            chunk_end = min(chunk_start + chunk_pings, pings)
+            ping = np.repeat(np.arange(chunk_start, chunk_end), n_channels)
+            channel = np.tile(np.arange(n_channels), chunk_end - chunk_start)
+            n_frames = len(ping)
+
+            lengths = np.empty(n_frames, dtype="int64")
+            for i, c in enumerate(channels):
+                length = ping_lengths[c]
+                if isinstance(length, tuple):
+                    lengths[channel == i] = rng.integers(length[0], length[1] + 1, size=(channel == i).sum())
+                else:
+                    lengths[channel == i] = length
+
+            frame_sizes = frame_header_size + lengths
+            offsets = np.concatenate([[0], np.cumsum(frame_sizes)[:-1]])
+
+            survey = channel_survey[channel]
+            sidescan = survey == 5
+            max_range = np.where(sidescan, 100.0, 60.0)
+            seconds = ping * 100 + channel
+            distance = speed * seconds / 1000
+
+            headers = np.zeros(n_frames, dtype=frame_dtype)
+            headers["first_byte"] = position + offsets
+            headers["frame_version"] = 10 if frame_dtype is sl3_frame_dtype else 8
+            headers["frame_size"] = frame_sizes
+            headers["prev_frame_size"] = np.concatenate([[prev_frame_size], frame_sizes[:-1]])
+            headers["survey_type"] = survey
+            headers["id"] = chunk_start * n_channels + np.arange(n_frames)
+            headers["min_range"] = np.where(sidescan, -max_range, 0)
+            headers["max_range"] = max_range
+            headers["frequency_type"] = np.where(survey == 1, 1, 0)
+            headers["hardware_time"] = 1694593236
+            headers["water_depth"] = 20 + 5 * np.sin(ping / 50)
+            headers["gps_speed"] = speed / 0.5144
+            headers["water_temperature"] = 15
+            headers["x"] = np.round(x0 + distance * math.cos(heading))
+            headers["y"] = np.round(y0 - distance * math.sin(heading))
+            headers["gps_heading"] = heading
+            headers["seconds"] = seconds
+            if frame_dtype is sl3_frame_dtype:
+                headers["echo_size"] = lengths
+
+            chunk = rng.integers(0, 256, size=frame_sizes.sum(), dtype="uint8")
+            chunk[offsets[:, None] + np.arange(frame_header_size)] = headers.view("uint8").reshape(n_frames, frame_header_size)
+            f.write(chunk.tobytes())
+
+            position += int(frame_sizes.sum())
+            prev_frame_size = int(frame_sizes[-1])
+
+    return(position)
+
+def pings_for_size(size: int, extension: str = "sl2", channels: list = ["primary", "secondary", "downscan", "sidescan"],
+                   ping_lengths: dict = default_ping_lengths) -> int:
+    '''Number of pings per channel giving a synthetic file of about "size" bytes'''
+
+    frame_header_size = (sl3_frame_dtype if extension == "sl3" else sl2_frame_dtype).itemsize
+    lengths = [ping_lengths[c] for c in channels]
+    bytes_per_ping = sum(frame_header_size + (sum(i) / 2 if isinstance(i, tuple) else i) for i in lengths)
+    return(max(1, int(size / bytes_per_ping)))
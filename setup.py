@@ -16,6 +16,7 @@ setup(
     long_description_content_type='text/markdown',
     packages=find_packages(),
     install_requires=["numpy", "pandas"],
+    extras_require={"arrow": ["pyarrow"]},
     keywords=['python'],
     classifiers= [
         "Development Status :: 3 - Alpha",
@@ -1,2 +1,18 @@
-from .sonar_class import Sonar
-from .version import __version__
\ No newline at end of file
+import importlib
+from .probe import probe
+from .version import __version__
+
+#Classes depending on pandas are imported when first used, so "import sonarlight" and probe() only load NumPy
+_lazy_imports = {"Sonar": ".sonar_class", "FrameIndex": ".frame_index", "Survey": ".survey", "load_many": ".batch"}
+
+__all__ = ["Sonar", "FrameIndex", "Survey", "load_many", "probe", "__version__"]
+
+def __getattr__(name: str):
+    if name in _lazy_imports:
+        value = getattr(importlib.import_module(_lazy_imports[name], __name__), name)
+        globals()[name] = value
+        return(value)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__() -> list:
+    return(sorted(list(globals()) + list(_lazy_imports)))
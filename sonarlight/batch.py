@@ -0,0 +1,92 @@
+#Parallel loading of multiple files
+
+import os
+import shutil
+import tempfile
+import uuid
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from .sonar_class import Sonar
+from .echo_store import EchoStore
+
+LoadResult = namedtuple("LoadResult", ["path", "sonar", "error"])
+
+def _share_dir() -> str:
+    #Memory backed file system on Linux, otherwise the temporary directory
+    shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    return(tempfile.mkdtemp(prefix="sonarlight_", dir=shm_dir))
+
+def _load_worker(path: str, sonar_kwargs: dict, share_dir: str):
+    try:
+        sonar = Sonar(path, **sonar_kwargs)
+
+        #The file buffer is not sent back to the parent process
+        sonar.buffer = None
+
+        for channel, echoes in sonar.echoes.items():
+            if share_dir is None:
+                sonar.echoes[channel] = EchoStore(echoes.values, echoes.offsets, echoes.index)
+            else:
+                values_path = os.path.join(share_dir, f"{uuid.uuid4().hex}.bin")
+                echoes.values.tofile(values_path)
+                sonar.echoes[channel] = (values_path, echoes.offsets, echoes.index)
+
+        return(sonar, None)
+
+    except Exception as e:
+        return(None, e)
+
+def _attach_echoes(values_path: str, offsets: np.ndarray, index: np.ndarray) -> EchoStore:
+    if offsets[-1] == 0:
+        values = np.empty(0, dtype="uint8")
+    else:
+        values = np.memmap(values_path, dtype="uint8", mode="r")
+
+    #The mapping stays valid after removing the file, except on Windows where the pixels are read into memory instead
+    try:
+        os.remove(values_path)
+    except OSError:
+        values = np.array(values)
+        os.remove(values_path)
+
+    return(EchoStore(values, offsets, index))
+
+def load_many(paths: list, workers: int = None, clean: bool = True, augment_coords: bool = False,
+              share_echoes: bool = True, **kwargs) -> list:
+    '''
+    Read multiple '.sl2' or '.sl3' files in parallel using a pool of processes.
+
+    Returns a list of LoadResult(path, sonar, error) in the same order as "paths".
+    If reading a file fails, "sonar" is None and "error" holds the exception, and the remaining files are still read.
+
+    Arguments:
+    workers - Number of processes, defaults to the number of CPUs.
+    clean, augment_coords - Passed to Sonar, as are any other keyword arguments.
+    share_echoes = True - (True is default) - Pass pixels from the worker processes through shared memory files instead of pickling them.
+    The pixels are memory-mapped in the returned Sonar objects.
+    '''
+
+    sonar_kwargs = dict(clean=clean, augment_coords=augment_coords, **kwargs)
+    share_dir = _share_dir() if share_echoes else None
+    results = []
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_load_worker, path, sonar_kwargs, share_dir) for path in paths]
+
+            for path, future in zip(paths, futures):
+                try:
+                    sonar, error = future.result()
+                except Exception as e:
+                    sonar, error = None, e
+
+                if sonar is not None and share_dir is not None:
+                    sonar.echoes = {channel: _attach_echoes(*echoes) for channel, echoes in sonar.echoes.items()}
+
+                results.append(LoadResult(path, sonar, error))
+    finally:
+        if share_dir is not None:
+            shutil.rmtree(share_dir, ignore_errors=True)
+
+    return(results)
@@ -0,0 +1,132 @@
+#On-disk cache of decoded files
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from .echo_store import EchoStore
+from .version import __version__
+
+#Attributes of a Sonar object restored from the cache in addition to the dataframe and pixels
+cached_attributes = ["version", "device_id", "blocksize", "reserved", "frame_version",
+                     "valid_channels", "valid_channels_records", "hardware_time_start"]
+
+def _cache_key(sonar) -> str:
+    stat = os.stat(sonar.path)
+    options = [os.path.abspath(sonar.path), stat.st_size, stat.st_mtime_ns, __version__,
+               sonar.clean, sonar.augment_coords, sonar.channels, sonar.columns, sonar.load_echoes, sonar.compact]
+    return(hashlib.sha1(json.dumps(options).encode()).hexdigest())
+
+def _to_json(value):
+    return(value.item() if isinstance(value, np.generic) else value)
+
+def _encode_column(column: pd.Series) -> tuple:
+    #Plain array of a dataframe column that can be saved without pickling, its kind and categories if categorical
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return("category", column.cat.codes.to_numpy(), column.cat.categories.tolist())
+    elif column.dtype == object or pd.api.types.is_string_dtype(column.dtype):
+        return("object", column.to_numpy().astype(str), None)
+    else:
+        return("array", column.to_numpy(), None)
+
+def _decode_column(values: np.ndarray, kind: str, categories: list = None):
+    if kind == "category":
+        return(pd.Categorical.from_codes(values, categories))
+    elif kind == "object":
+        return(values.astype(object))
+    return(values)
+
+def _dir_size(path: str) -> int:
+    return(sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)))
+
+def read_cache(sonar) -> bool:
+    '''Restore the dataframe, pixels and attributes of a Sonar object from the cache, returns False if not cached'''
+
+    if sonar.cache_dir is None:
+        return(False)
+
+    entry = os.path.join(sonar.cache_dir, _cache_key(sonar))
+    meta_path = os.path.join(entry, "meta.json")
+    if not os.path.exists(meta_path):
+        return(False)
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+
+    columns = {}
+    for i, (name, kind) in enumerate(meta["columns"]):
+        columns[name] = _decode_column(np.load(os.path.join(entry, f"column_{i}.npy")), kind, meta["categories"].get(name))
+
+    sonar.df = pd.DataFrame(columns, index=pd.Index(np.load(os.path.join(entry, "index.npy"))))
+    sonar.echoes = {}
+    for channel in meta["echoes"]:
+        sonar.echoes[channel] = EchoStore(np.load(os.path.join(entry, f"echoes_{channel}_values.npy"), mmap_mode="r"),
+                                          np.load(os.path.join(entry, f"echoes_{channel}_offsets.npy")),
+                                          np.load(os.path.join(entry, f"echoes_{channel}_index.npy")))
+
+    for name in cached_attributes:
+        setattr(sonar, name, meta["attributes"][name])
+
+    sonar.buffer = None
+
+    #Mark the entry as recently used for eviction
+    os.utime(entry)
+
+    return(True)
+
+def write_cache(sonar):
+    '''Store the dataframe, pixels and attributes of a Sonar object in the cache and evict the least recently used entries above the cache size'''
+
+    if sonar.cache_dir is None:
+        return
+
+    os.makedirs(sonar.cache_dir, exist_ok=True)
+    entry = os.path.join(sonar.cache_dir, _cache_key(sonar))
+    tmp_entry = tempfile.mkdtemp(dir=sonar.cache_dir, prefix=".tmp_")
+
+    try:
+        meta = {"columns": [], "categories": {}, "echoes": list(sonar.echoes),
+                "attributes": {name: _to_json(getattr(sonar, name)) for name in cached_attributes}}
+
+        for i, name in enumerate(sonar.df.columns):
+            kind, values, categories = _encode_column(sonar.df[name])
+            if categories is not None:
+                meta["categories"][name] = categories
+            meta["columns"].append([name, kind])
+            np.save(os.path.join(tmp_entry, f"column_{i}.npy"), values, allow_pickle=False)
+
+        np.save(os.path.join(tmp_entry, "index.npy"), sonar.df.index.to_numpy(), allow_pickle=False)
+
+        for channel, echoes in sonar.echoes.items():
+            np.save(os.path.join(tmp_entry, f"echoes_{channel}_values.npy"), echoes.values, allow_pickle=False)
+            np.save(os.path.join(tmp_entry, f"echoes_{channel}_offsets.npy"), echoes.offsets, allow_pickle=False)
+            np.save(os.path.join(tmp_entry, f"echoes_{channel}_index.npy"), echoes.index, allow_pickle=False)
+
+        #Written last, as a complete entry is recognized by this file
+        with open(os.path.join(tmp_entry, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+        os.rename(tmp_entry, entry)
+
+    except OSError:
+        #Another process may have written the same entry in the meantime
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        return
+
+    _evict(sonar.cache_dir, sonar.cache_size, keep=entry)
+
+def _evict(cache_dir: str, cache_size: int, keep: str):
+    entries = [os.path.join(cache_dir, i) for i in os.listdir(cache_dir) if not i.startswith(".")]
+    entries = sorted(entries, key=os.path.getmtime)
+    sizes = {i: _dir_size(i) for i in entries}
+    total_size = sum(sizes.values())
+
+    for i in entries:
+        if total_size <= cache_size:
+            break
+        if i != keep:
+            shutil.rmtree(i, ignore_errors=True)
+            total_size -= sizes[i]
@@ -0,0 +1,171 @@
+#Definition of EchoStore class
+
+import numpy as np
+
+def _gather_pings(data: np.ndarray, starts: np.ndarray, lengths: np.ndarray, chunk_size: int = 2**24) -> np.ndarray:
+    '''Copy pings of the given start positions and lengths from a 'uint8' array into one contiguous array.
+    Pings are copied in chunks to bound the scratch memory to about "chunk_size" / 4 bytes'''
+
+    values = np.empty(int(lengths.sum()), dtype="uint8")
+
+    if len(lengths) == 0:
+        return(values)
+
+    if (lengths == lengths[0]).all():
+        if lengths[0] > 0:
+            #Pings are copied into the output in chunks, as indexing the window view of all pings at once creates a full temporary copy
+            ping_len = int(lengths[0])
+            ping_windows = np.lib.stride_tricks.sliding_window_view(data, ping_len)
+            matrix = values.reshape(len(lengths), ping_len)
+            chunk_pings = max(1, chunk_size // 4 // ping_len)
+            for first in range(0, len(lengths), chunk_pings):
+                matrix[first:(first + chunk_pings)] = ping_windows[starts[first:(first + chunk_pings)]]
+        return(values)
+
+    #Index arrays take 8 bytes per pixel, and two are needed at a time, 
+    #so chunks are kept to the same scratch memory as the chunks of equal length pings
+    chunk_pixels = max(1, chunk_size // 64)
+    ends = np.cumsum(lengths)
+    chunk_edges = np.searchsorted(ends, np.arange(chunk_pixels, ends[-1], chunk_pixels), side="right")
+
+    for first, last in zip(np.concatenate([[0], chunk_edges]), np.concatenate([chunk_edges, [len(lengths)]])):
+        if first == last:
+            continue
+        chunk_start = ends[first] - lengths[first]
+        chunk_lengths = lengths[first:last]
+        chunk_offsets = ends[first:last] - chunk_lengths - chunk_start
+        index = np.repeat(starts[first:last] - chunk_offsets, chunk_lengths)
+        index += np.arange(len(index))
+        values[chunk_start:ends[last-1]] = data[index]
+
+    return(values)
+
+def _strided_pings(data: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    '''Read-only 2-D view of pings of equal length at evenly spaced positions in a 'uint8' array, 
+    e.g. the pings of a log with a single channel. None if the pings are not evenly spaced'''
+
+    if len(starts) < 2 or lengths[0] == 0 or not (lengths == lengths[0]).all():
+        return(None)
+
+    step = int(starts[1] - starts[0])
+    if step <= 0 or not (np.diff(starts) == step).all():
+        return(None)
+
+    return(np.lib.stride_tricks.as_strided(data[starts[0]:], shape=(len(starts), int(lengths[0])),
+                                           strides=(step * data.strides[0], data.strides[0]), writeable=False))
+
+class EchoStore:
+    '''
+    Contiguous storage of the pixels of all pings of a channel.
+
+    The pixels of all pings are stored one after another in the 'uint8' array "values"
+    and ping i spans values[offsets[i]:offsets[i+1]]. If all pings have the same length,
+    "matrix" is a 2-D view of "values" with one row per ping. The "index" array holds
+    the row labels of the pings in the Sonar dataframe.
+
+    When created with "from_buffer", pixels are only copied from the file buffer the first time they are used,
+    and "matrix" is a view of the file buffer without copying if the pings are of equal length and evenly spaced in the buffer.
+    '''
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray, index: np.ndarray):
+        self._values = values
+        self._source = None
+        self.offsets = offsets
+        self.index = index
+
+    @classmethod
+    def from_buffer(cls, buffer, starts: np.ndarray, lengths: np.ndarray, index: np.ndarray):
+        '''Create a store of the pings at the given start positions and lengths in a file buffer'''
+
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype("int64")
+        store = cls(None, offsets, np.asarray(index))
+        store._source = (buffer, np.asarray(starts, dtype="int64"), np.asarray(lengths, dtype="int64"))
+        return(store)
+
+    @property
+    def values(self) -> np.ndarray:
+        #Pixels are stored before the source is released, so a missing source means another thread has gathered the pixels
+        source = self._source
+        if self._values is None and source is not None:
+            buffer, starts, lengths = source
+            values = _gather_pings(np.frombuffer(buffer, dtype="uint8"), starts, lengths)
+            values.flags.writeable = False
+            self._values = values
+            self._source = None
+        return(self._values)
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return(np.diff(self.offsets))
+
+    @property
+    def uniform(self) -> bool:
+        '''True if all pings have the same length'''
+        lengths = self.lengths
+        return(len(lengths) == 0 or bool((lengths == lengths[0]).all()))
+
+    @property
+    def matrix(self) -> np.ndarray:
+        '''2-D view of the pixels with one row per ping, only available if all pings have the same length'''
+
+        if not self.uniform:
+            raise ValueError("Pings have different lengths and cannot be viewed as a matrix")
+
+        source = self._source
+        if self._values is None and source is not None:
+            buffer, starts, lengths = source
+            pings = _strided_pings(np.frombuffer(buffer, dtype="uint8"), starts, lengths)
+            if pings is not None:
+                return(pings)
+
+        ping_len = int(self.offsets[1]) if len(self) > 0 else 0
+        return(self.values.reshape(len(self), ping_len))
+
+    def pings(self, first: int, last: int) -> np.ndarray:
+        '''Pixels of the pings at positions first to last, one after another as in "values".
+        If the pixels have not been stored, only these pings are copied from the file buffer'''
+
+        source = self._source
+        if self._values is None and source is not None:
+            buffer, starts, lengths = source
+            return(_gather_pings(np.frombuffer(buffer, dtype="uint8"), starts[first:last], lengths[first:last]))
+        return(self.values[self.offsets[first]:self.offsets[last]])
+
+    def take(self, positions: np.ndarray):
+        '''New store with the pings at the given positions.
+        If the pixels have not been stored, the new store also copies its pixels from the file buffer when first used'''
+
+        positions = np.asarray(positions, dtype="int64")
+        source = self._source
+        if self._values is None and source is not None:
+            buffer, starts, lengths = source
+            return(EchoStore.from_buffer(buffer, starts[positions], lengths[positions], self.index[positions]))
+
+        starts = self.offsets[:-1][positions]
+        lengths = self.lengths[positions]
+        values = _gather_pings(self.values, starts, lengths)
+        values.flags.writeable = False
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype("int64")
+        return(EchoStore(values, offsets, self.index[positions]))
+
+    def positions(self, index) -> np.ndarray:
+        '''Positions of the pings with the given row labels'''
+
+        index = np.asarray(index)
+        if len(index) == 0:
+            return(np.empty(0, dtype="int64"))
+        
+        sorter = np.argsort(self.index, kind="stable")
+        found = sorter[np.searchsorted(self.index, index, sorter=sorter).clip(0, max(len(self) - 1, 0))]
+        if len(self) == 0 or not (self.index[found] == index).all():
+            raise KeyError("Rows not found in echo store")
+        return(found)
+
+    def __len__(self) -> int:
+        return(len(self.offsets) - 1)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return(self.values[self.offsets[i]:self.offsets[i+1]])
+
+    def __repr__(self) -> str:
+        return(f"EchoStore with {len(self)} pings and {self.offsets[-1]} pixels")
@@ -0,0 +1,168 @@
+#Export of decoded files to columnar formats and loading of exported files
+
+import json
+import numpy as np
+import pandas as pd
+from .echo_store import EchoStore, _gather_pings
+from .cache import cached_attributes, _to_json, _encode_column, _decode_column
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Arrow and Parquet export requires the 'pyarrow' package, install it with 'pip install pyarrow'")
+    return(pyarrow)
+
+def _export_meta(sonar) -> dict:
+    #Options and attributes needed to restore a Sonar object from an export
+    return({"source_path": sonar.path, "clean": sonar.clean, "augment_coords": sonar.augment_coords,
+            "channels": sonar.channels, "columns": sonar.columns, "echoes": list(sonar.echoes),
+            "attributes": {name: _to_json(getattr(sonar, name)) for name in cached_attributes}})
+
+def _row_echoes(sonar) -> tuple:
+    #Pixels of all channels in the row order of the dataframe, as the values and offsets of a binary column.
+    #Rows of channels without pixels are empty
+    starts = np.zeros(sonar.df.shape[0], dtype="int64")
+    lengths = np.zeros(sonar.df.shape[0], dtype="int64")
+    channel_values = []
+    position = 0
+
+    for channel in sonar.echoes:
+        rows = sonar._channel_rows(channel)
+        echoes = sonar._channel_echoes(channel)
+        starts[rows] = echoes.offsets[:-1] + position
+        lengths[rows] = echoes.lengths
+        channel_values.append(echoes.values)
+        position += len(echoes.values)
+
+    values = np.concatenate(channel_values) if channel_values else np.empty(0, dtype="uint8")
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype("int64")
+
+    return(_gather_pings(values, starts, lengths), offsets)
+
+def _split_echoes(df: pd.DataFrame, channels: list, buffer, offsets: np.ndarray) -> dict:
+    #Lazy echo stores of each channel from a binary column in the row order of the dataframe
+    survey = df["survey"].to_numpy()
+    echoes = {}
+
+    for channel in channels:
+        rows = np.flatnonzero(survey == channel)
+        echoes[channel] = EchoStore.from_buffer(buffer, offsets[rows], offsets[rows + 1] - offsets[rows], df.index[rows].to_numpy())
+
+    return(echoes)
+
+def _read_columns(columns: list, available: list) -> list:
+    if columns is None:
+        return(available)
+
+    missing = [i for i in columns if i not in available]
+    if missing:
+        raise ValueError(f'Columns not in export: {", ".join(missing)}')
+
+    return(columns if "survey" in columns else ["survey"] + list(columns))
+
+def to_arrow(sonar):
+    '''Arrow table of the dataframe with an "echoes" binary column holding the pixels of each row'''
+
+    pa = _import_pyarrow()
+    table = pa.Table.from_pandas(sonar.df, preserve_index=True)
+
+    if sonar.echoes:
+        values, offsets = _row_echoes(sonar)
+        echoes = pa.LargeBinaryArray.from_buffers(pa.large_binary(), len(offsets) - 1,
+                                                  [None, pa.py_buffer(offsets), pa.py_buffer(values)])
+        table = table.append_column("echoes", echoes)
+
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"sonarlight"] = json.dumps(_export_meta(sonar)).encode()
+
+    return(table.replace_schema_metadata(metadata))
+
+def to_parquet(sonar, path: str, **kwargs):
+    pa = _import_pyarrow()
+    pa.parquet.write_table(to_arrow(sonar), path, **kwargs)
+
+def to_npz(sonar, path: str, compressed: bool = False):
+    meta = _export_meta(sonar)
+    meta["columns_kind"] = []
+    meta["categories"] = {}
+    arrays = {"index": sonar.df.index.to_numpy()}
+
+    for i, name in enumerate(sonar.df.columns):
+        kind, values, categories = _encode_column(sonar.df[name])
+        if categories is not None:
+            meta["categories"][name] = categories
+        meta["columns_kind"].append([name, kind])
+        arrays[f"column_{i}"] = values
+
+    for channel in sonar.echoes:
+        echoes = sonar._channel_echoes(channel)
+        arrays[f"echoes_{channel}_values"] = echoes.values
+        arrays[f"echoes_{channel}_offsets"] = echoes.offsets
+        arrays[f"echoes_{channel}_index"] = echoes.index
+
+    arrays["meta"] = np.array(json.dumps(meta))
+
+    if compressed:
+        np.savez_compressed(path, **arrays)
+    else:
+        np.savez(path, **arrays)
+
+def read_export(path: str, columns: list = None, load_echoes: bool = True, filters: list = None) -> tuple:
+    '''Read the dataframe, pixels and export metadata from a '.npz' or Arrow/Parquet export'''
+
+    if path.endswith(".npz"):
+        if filters is not None:
+            raise ValueError("Filters are only supported for Parquet exports")
+        return(_read_npz(path, columns, load_echoes))
+
+    return(_read_parquet(path, columns, load_echoes, filters))
+
+def _read_npz(path: str, columns: list, load_echoes: bool) -> tuple:
+    with np.load(path, allow_pickle=False) as f:
+        meta = json.loads(str(f["meta"]))
+        kinds = {name: (i, kind) for i, (name, kind) in enumerate(meta["columns_kind"])}
+
+        df_columns = {}
+        for name in _read_columns(columns, list(kinds)):
+            i, kind = kinds[name]
+            df_columns[name] = _decode_column(f[f"column_{i}"], kind, meta["categories"].get(name))
+
+        df = pd.DataFrame(df_columns, index=pd.Index(f["index"]))
+
+        echoes = {}
+        if load_echoes:
+            for channel in meta["echoes"]:
+                values = f[f"echoes_{channel}_values"]
+                values.flags.writeable = False
+                echoes[channel] = EchoStore(values, f[f"echoes_{channel}_offsets"], f[f"echoes_{channel}_index"])
+
+    return(df, echoes, meta)
+
+def _read_parquet(path: str, columns: list, load_echoes: bool, filters: list) -> tuple:
+    pa = _import_pyarrow()
+    schema = pa.parquet.read_schema(path)
+    meta = json.loads(schema.metadata[b"sonarlight"])
+
+    index_columns = [i for i in schema.names if i.startswith("__index_level_")]
+    available = [i for i in schema.names if i != "echoes" and i not in index_columns]
+    read_columns = _read_columns(columns, available) + index_columns
+    load_echoes = load_echoes and "echoes" in schema.names
+
+    table = pa.parquet.read_table(path, columns=read_columns + ["echoes"] if load_echoes else read_columns, filters=filters)
+
+    echoes = {}
+    if load_echoes:
+        pixels = table.column("echoes").combine_chunks()
+        table = table.drop_columns(["echoes"])
+        df = table.to_pandas()
+
+        #Offsets and values buffers of the binary column
+        _, offsets_buffer, values_buffer = pixels.buffers()
+        offsets = np.frombuffer(offsets_buffer, dtype="int64")[pixels.offset:(pixels.offset + len(pixels) + 1)]
+        echoes = _split_echoes(df, meta["echoes"], b"" if values_buffer is None else values_buffer, offsets)
+    else:
+        df = table.to_pandas()
+
+    return(df, echoes, meta)
@@ -0,0 +1,216 @@
+#Frame formats of the '.sl2' and '.sl3' files and reading of frame headers, only depending on NumPy
+
+import math
+import struct
+import numpy as np
+
+#dtype for '.sl2' files (144 bytes)
+sl2_frame_dtype = np.dtype([
+    ("first_byte", "<u4"),
+    ("frame_version", "<u4"),
+    ("unknown8", "<f4"),
+    ("unknown12", "<f4"),
+    ("unknown16", "<f4"),
+    ("unknown20", "<f4"),
+    ("unknown24", "<f4"),
+    ("frame_size", "<u2"),
+    ("prev_frame_size", "<u2"),
+    ("survey_type", "<u2"),
+    ("packet_size", "<u2"),
+    ("id", "<u4"),
+    ("min_range", "<f4"),
+    ("max_range", "<f4"),
+    ("unknown48", "<f4"),
+    ("unknown52", "<u1"),
+    ("frequency_type", "<u2"),
+    ("unknown55", "<u1"),
+    ("unknown56", "<f4"),
+    ("hardware_time", "<u4"),
+    ("water_depth", "<f4"),
+    ("unknown68", "<f4"),
+    ("unknown72", "<f4"),
+    ("unknown76", "<f4"),
+    ("unknown80", "<f4"),
+    ("unknown84", "<f4"),
+    ("unknown88", "<f4"),
+    ("unknown92", "<f4"),
+    ("unknown96", "<f4"),
+    ("gps_speed", "<f4"),
+    ("water_temperature", "<f4"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("water_speed", "<f4"),
+    ("gps_heading", "<f4"),
+    ("gps_altitude", "<f4"),
+    ("magnetic_heading", "<f4"),
+    ("flags", "<u2"),
+    ("unknown132", "<u2"),
+    ("unknown136", "<f4"),
+    ("seconds", "<u4")
+])
+
+#dtype for '.sl3' files (168 bytes)
+sl3_frame_dtype = np.dtype([
+    ("first_byte", "<u4"),
+    ("frame_version", "<u4"),
+    ("frame_size", "<u2"),
+    ("prev_frame_size", "<u2"),
+    ("survey_type", "<u2"),
+    ("unknown14", "<i2"),
+    ("id", "<u4"),
+    ("min_range", "<f4"),
+    ("max_range", "<f4"),
+    ("unknown28", "<f4"),
+    ("unknown32", "<f4"),
+    ("unknown36", "<f4"),
+    ("hardware_time", "<u4"),
+    ("echo_size", "<u4"),
+    ("water_depth", "<f4"),
+    ("frequency_type", "<u2"),
+    ("unknown54", "<f4"),
+    ("unknown58", "<f4"),
+    ("unknown62", "<i2"),
+    ("unknown64", "<f4"),
+    ("unknown68", "<f4"),
+    ("unknown72", "<f4"),
+    ("unknown76", "<f4"),
+    ("unknown80", "<f4"),
+    ("gps_speed", "<f4"),
+    ("water_temperature", "<f4"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("water_speed", "<f4"),
+    ("gps_heading", "<f4"),
+    ("gps_altitude", "<f4"),
+    ("magnetic_heading", "<f4"),
+    ("flags", "<u2"),
+    ("unknown118", "<u2"),
+    ("unknown120", "<u4"),
+    ("seconds", "<u4"), #milliseconds
+    ("prev_primary_offset", "<u4"),
+    ("prev_secondary_offset", "<u4"),
+    ("prev_downscan_offset", "<u4"),
+    ("prev_left_sidescan_offset", "<u4"),
+    ("prev_right_sidescan_offset", "<u4"),
+    ("prev_sidescan_offset", "<u4"),
+    ("unknown152", "<u4"),
+    ("unknown156", "<u4"),
+    ("unknown160", "<u4"),
+    ("prev_3d_offseft", "<u4")
+])
+
+def _frame_sizes(data: np.ndarray, positions: np.ndarray, frame_size_offset: int) -> np.ndarray:
+    '''Read the little-endian "frame_size" field of the frames starting at the given positions'''
+    
+    size_positions = positions + frame_size_offset
+    return(data[size_positions].astype("int64") | (data[size_positions + 1].astype("int64") << 8))
+
+def _repeating_period(sizes: list, max_period: int) -> int:
+    '''Find the shortest period with which the most recent frame sizes repeat, 0 if none'''
+
+    for period in range(1, min(max_period, len(sizes)//2) + 1):
+        if sizes[-period:] == sizes[-2*period:-period]:
+            return(period)
+    return(0)
+
+def _frame_offsets(buffer, frame_header_size: int, frame_size_offset: int, max_period: int = 16, max_block: int = 65536) -> np.ndarray:
+    '''Find the offset of each frame in a buffer by jumping from frame to frame using the "frame_size" field.
+    
+    Channels are usually logged in a fixed order with fixed ping lengths, so the frame sizes repeat with a short period. 
+    When they do, the positions of a block of following frames are predicted from the repeating sizes 
+    and verified at once by reading their "frame_size" fields with NumPy. Frames up to the first mismatch are accepted, 
+    which gives exactly the same offsets as walking the frames one by one. Otherwise, frames are walked one at a time 
+    reading only the two bytes holding the frame size.
+    As in the original frame walk, a frame is only kept if more data follows it in the buffer'''
+
+    data = np.frombuffer(buffer, dtype="uint8")
+    unpack_frame_size = struct.Struct("<H").unpack_from
+    buffer_len = len(data)
+    last_header_start = buffer_len - frame_header_size
+
+    offsets = []
+    walked = []
+    recent_sizes = []
+    walk_steps = 2*max_period
+    block = 64
+    position = 0
+    end_of_frames = False
+
+    while position <= last_header_start:
+        for _ in range(walk_steps):
+            frame_size = unpack_frame_size(data, position + frame_size_offset)[0]
+            if frame_size == 0:
+                end_of_frames = True
+                break
+            walked.append(position)
+            recent_sizes.append(frame_size)
+            position += frame_size
+            if position > last_header_start:
+                break
+
+        if end_of_frames or position > last_header_start:
+            break
+
+        recent_sizes = recent_sizes[-2*max_period:]
+        period = _repeating_period(recent_sizes, max_period)
+        n_verified = 0
+
+        if period:
+            predicted_sizes = np.tile(np.array(recent_sizes[-period:], dtype="int64"), block//period + 1)[:block]
+            predicted_positions = position + np.concatenate([[0], np.cumsum(predicted_sizes[:-1])])
+            in_buffer = predicted_positions <= last_header_start
+            predicted_positions = predicted_positions[in_buffer]
+            predicted_sizes = predicted_sizes[in_buffer]
+
+            mismatch = np.flatnonzero(_frame_sizes(data, predicted_positions, frame_size_offset) != predicted_sizes)
+            n_verified = mismatch[0] if len(mismatch) > 0 else len(predicted_positions)
+
+        if n_verified > 0:
+            offsets.append(np.array(walked, dtype="int64"))
+            offsets.append(predicted_positions[:n_verified])
+            walked = []
+            recent_sizes = recent_sizes + predicted_sizes[max(n_verified-2*max_period, 0):n_verified].tolist()
+            position = int(predicted_positions[n_verified-1] + predicted_sizes[n_verified-1])
+            block = min(block*2, max_block) if len(mismatch) == 0 else 64
+
+        #Back off from predicting when the frame sizes do not repeat for long
+        walk_steps = 1 if n_verified >= 64 else min(walk_steps*2, 1024)
+
+    offsets.append(np.array(walked, dtype="int64"))
+    offsets = np.concatenate(offsets)
+
+    if len(offsets) > 0 and position >= buffer_len:
+        offsets = offsets[:-1]
+
+    return(offsets)
+
+def _frame_headers(buffer, offsets: np.ndarray, frame_dtype: np.dtype) -> np.ndarray:
+    '''Gather the frame headers starting at the given offsets into a structured array'''
+
+    if len(offsets) == 0:
+        return(np.empty(0, dtype=frame_dtype))
+
+    data = np.frombuffer(buffer, dtype="uint8")
+    header_windows = np.lib.stride_tricks.sliding_window_view(data, frame_dtype.itemsize)
+    
+    return(header_windows[offsets].view(frame_dtype).ravel())
+
+#Names of the survey types of the frames
+survey_types = {0: 'primary', 1: 'secondary', 2: 'downscan',
+                3: 'left_sidescan', 4: 'right_sidescan', 5: 'sidescan'}
+
+#Channels that can be selected and extracted
+supported_channels = ["primary", "secondary", "downscan", "sidescan"]
+
+def _survey_codes(channels: list) -> list:
+    #Survey type codes of a list of channel names
+    unknown_channels = [i for i in channels if i not in supported_channels]
+    if unknown_channels:
+        raise ValueError(f'Unknown channels: {", ".join(unknown_channels)}. Supported channels: {", ".join(supported_channels)}')
+    return([k for k, v in survey_types.items() if v in channels])
+
+def _x2lon(x):
+    return(x/6356752.3142*(180/math.pi))
+
+def _y2lat(y):
+    return(((2*np.arctan(np.exp(y/6356752.3142)))-(math.pi/2))*(180/math.pi))
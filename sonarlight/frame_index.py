@@ -0,0 +1,173 @@
+#Definition of FrameIndex class
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from .sonar_class import Sonar
+from .formats import sl2_frame_dtype, sl3_frame_dtype, _frame_offsets, _frame_headers, _survey_codes, _x2lon, _y2lat
+from .version import __version__
+
+#dtype of the index entry of each frame
+index_dtype = np.dtype([
+    ("offset", "<i8"), #position of the frame in the file
+    ("size", "<u2"),
+    ("survey_type", "<u2"),
+    ("time", "<f8"), #seconds since epoch, as the "datetime" column
+    ("x", "<i4"),
+    ("y", "<i4")
+])
+
+def _select_frames(frames: np.ndarray, time_range: tuple = None, bbox: tuple = None, channel = None) -> np.ndarray:
+    #Positions of the frames of an index array matching all of the given conditions, see FrameIndex.select()
+    keep = np.ones(len(frames), dtype=bool)
+
+    if time_range is not None:
+        start, end = [pd.Timestamp(i).value / 1e9 for i in time_range]
+        keep &= (frames["time"] >= start) & (frames["time"] <= end)
+
+    if bbox is not None:
+        lon_min, lat_min, lon_max, lat_max = bbox
+        longitude = _x2lon(frames["x"])
+        latitude = _y2lat(frames["y"])
+        keep &= (longitude >= lon_min) & (longitude <= lon_max) & (latitude >= lat_min) & (latitude <= lat_max)
+
+    if channel is not None:
+        channels = [channel] if isinstance(channel, str) else channel
+        keep &= np.isin(frames["survey_type"], _survey_codes(channels))
+
+    return(np.flatnonzero(keep))
+
+class FrameIndex:
+    '''
+    Index of the frames in a '.sl2' or '.sl3' file for reading only the frames of a time window, an area or a channel.
+
+    The index holds the position, size, survey type, time and x/y coordinates of each frame in the "frames" structured array.
+    It is built from the frame headers without decoding the pixels and can be saved in a sidecar file next to the sonar file.
+    Use Sonar.open_index() to build or load the index of a file.
+    '''
+
+    def __init__(self, path: str, frames: np.ndarray, hardware_time_start: int = None):
+        self.path = path
+        self.frames = frames
+        self.hardware_time_start = hardware_time_start
+
+    @classmethod
+    def build(cls, path: str, chunk_frames: int = 2**16):
+        '''Build the index by walking the frame headers of a file, reading the headers in chunks of "chunk_frames" frames'''
+
+        file_header_size = 8
+        frame_dtype = sl3_frame_dtype if "sl3" in path.split(".")[-1] else sl2_frame_dtype
+        buffer = np.memmap(path, dtype="uint8", mode="r")[file_header_size:]
+        offsets = _frame_offsets(buffer, frame_dtype.itemsize, frame_dtype.fields["frame_size"][1])
+
+        frames = np.empty(len(offsets), dtype=index_dtype)
+        hardware_time_start = None
+
+        for first in range(0, len(offsets), chunk_frames):
+            headers = _frame_headers(buffer, offsets[first:(first + chunk_frames)], frame_dtype)
+            if hardware_time_start is None:
+                hardware_time_start = int(headers["hardware_time"][0])
+
+            chunk = frames[first:(first + chunk_frames)]
+            chunk["offset"] = headers["first_byte"]
+            chunk["size"] = headers["frame_size"]
+            chunk["survey_type"] = headers["survey_type"]
+            chunk["time"] = hardware_time_start + headers["seconds"] / 1000
+            chunk["x"] = headers["x"]
+            chunk["y"] = headers["y"]
+
+        return(cls(path, frames, hardware_time_start))
+
+    @classmethod
+    def open(cls, path: str, sidecar: bool = True):
+        '''Load the index of a file from its sidecar file, or build it and save the sidecar file if missing or outdated'''
+
+        if not sidecar:
+            return(cls.build(path))
+
+        index_path = cls.sidecar_path(path)
+        if os.path.exists(index_path):
+            with np.load(index_path, allow_pickle=False) as f:
+                meta = json.loads(str(f["meta"]))
+                if meta["source"] == cls._source(path):
+                    return(cls(path, f["frames"], meta["hardware_time_start"]))
+
+        index = cls.build(path)
+
+        #The index is still usable if the sidecar file cannot be written, e.g. in a read-only directory
+        try:
+            index.save(index_path)
+        except OSError:
+            pass
+
+        return(index)
+
+    @staticmethod
+    def sidecar_path(path: str) -> str:
+        return(path + ".index.npz")
+
+    @staticmethod
+    def _source(path: str) -> list:
+        #Identifies the indexed version of the file
+        stat = os.stat(path)
+        return([stat.st_size, stat.st_mtime_ns, __version__])
+
+    def save(self, index_path: str = None):
+        '''Save the index to a sidecar file, by default next to the sonar file'''
+
+        index_path = self.sidecar_path(self.path) if index_path is None else index_path
+        meta = {"source": self._source(self.path), "hardware_time_start": self.hardware_time_start}
+
+        #np.savez adds the '.npz' extension to the temporary file name unless present
+        tmp_path = index_path + ".tmp.npz"
+        np.savez(tmp_path, frames=self.frames, meta=np.array(json.dumps(meta)))
+        os.replace(tmp_path, index_path)
+
+    def select(self, time_range: tuple = None, bbox: tuple = None, channel = None) -> np.ndarray:
+        '''
+        Positions of the frames matching all of the given conditions.
+
+        Arguments:
+        time_range = (start, end) - Datetimes or strings accepted by pd.Timestamp, both included.
+        bbox = (lon_min, lat_min, lon_max, lat_max) - Bounding box in longitude/latitude.
+        channel = "sidescan" or ["primary", "sidescan"] - Channel or list of channels.
+        '''
+
+        return(_select_frames(self.frames, time_range, bbox, channel))
+
+    def read(self, time_range: tuple = None, bbox: tuple = None, channel = None,
+             clean: bool = True, columns: list = None, load_echoes: bool = True) -> Sonar:
+        '''
+        Decode only the frames matching the conditions of select() from the memory-mapped file into a Sonar object.
+
+        Datetimes are computed as when reading the whole file and the dataframe row labels are frame numbers in the file.
+        Coordinate augmentation is not available when reading from the index.
+
+        Arguments:
+        time_range, bbox, channel - Conditions passed to select().
+        clean, columns, load_echoes - Passed to Sonar.
+        '''
+
+        positions = self.select(time_range, bbox, channel)
+        return(self._read(positions, positions, channel, clean, columns, load_echoes))
+
+    def _read(self, positions: np.ndarray, labels: np.ndarray, channel, clean: bool, columns: list, load_echoes: bool) -> Sonar:
+        #Decode the frames at the given positions in the index, labelling the rows with "labels"
+        channels = None if channel is None else ([channel] if isinstance(channel, str) else list(channel))
+
+        sonar = Sonar.__new__(Sonar)
+        sonar._setup(self.path, clean, False, True, channels, columns, load_echoes)
+        sonar._read_bin()
+        sonar._parse_header()
+        sonar.hardware_time_start = self.hardware_time_start
+        sonar._decode(self.frames["offset"][positions] - sonar.file_header_size, labels=labels)
+        sonar._build()
+
+        return(sonar)
+
+    def __len__(self) -> int:
+        return(len(self.frames))
+
+    def __repr__(self) -> str:
+        return(f"FrameIndex of {self.path} with {len(self)} frames")
@@ -0,0 +1,102 @@
+#Quick summary of a file from the file header and a sample of frame headers, only depending on NumPy
+
+import os
+import numpy as np
+from collections import namedtuple
+from .formats import sl2_frame_dtype, sl3_frame_dtype, survey_types, _x2lon, _y2lat
+
+ProbeResult = namedtuple("ProbeResult", ["path", "format", "version", "device_id", "blocksize", "channels",
+                                         "frames", "start_time", "end_time", "bbox"])
+
+def _window_headers(data: np.ndarray, position: int, frame_dtype: np.dtype) -> np.ndarray:
+    '''Headers of the consecutive frames in a window of bytes read from the file at "position".
+
+    The first frame is found from the "first_byte" field, which holds the position of the frame in the file,
+    and is accepted if the "first_byte" field of the following frame is also found where its frame size points'''
+
+    header_size = frame_dtype.itemsize
+    frame_size_offset = frame_dtype.fields["frame_size"][1]
+    if len(data) < header_size:
+        return(np.empty(0, dtype=frame_dtype))
+
+    #Little-endian 32-bit value starting at each byte
+    b = data.astype("uint32")
+    values = b[:-3] | (b[1:-2] << 8) | (b[2:-1] << 16) | (b[3:] << 24)
+    candidates = np.flatnonzero(values == position + np.arange(len(values), dtype="uint32"))
+
+    first = None
+    for i in candidates[candidates + header_size <= len(data)]:
+        frame_size = int(data[i + frame_size_offset]) | (int(data[i + frame_size_offset + 1]) << 8)
+        following = i + frame_size
+        if frame_size >= header_size and (following + 4 > len(data) or values[following] == position + following):
+            first = i
+            break
+
+    if first is None:
+        return(np.empty(0, dtype=frame_dtype))
+
+    positions = []
+    i = first
+    while i + header_size <= len(data):
+        frame_size = int(data[i + frame_size_offset]) | (int(data[i + frame_size_offset + 1]) << 8)
+        if frame_size < header_size:
+            break
+        positions.append(i)
+        i += frame_size
+
+    windows = np.lib.stride_tricks.sliding_window_view(data, header_size)
+    return(windows[positions].view(frame_dtype).ravel())
+
+def probe(path: str, samples: int = 16, window: int = 2**15) -> ProbeResult:
+    '''
+    Summarize a '.sl2' or '.sl3' file without decoding it, e.g. for building a catalog of many files.
+
+    Only the file header and the frame headers in "samples" windows of "window" bytes spread evenly over the file are read.
+    The number of frames is estimated from the mean size of the sampled frames, and the channels and bounding box are
+    those of the sampled frames, so short gaps in a channel or excursions between the samples are not seen.
+    Times are computed as the "datetime" column of Sonar.
+
+    Returns a ProbeResult(path, format, version, device_id, blocksize, channels, frames, start_time, end_time, bbox)
+    where the times are NumPy datetimes and bbox is (lon_min, lat_min, lon_max, lat_max) or None without coordinates.
+    '''
+
+    file_header_size = 8
+    extension = path.split(".")[-1]
+    frame_dtype = sl3_frame_dtype if "sl3" in extension else sl2_frame_dtype
+    file_size = os.path.getsize(path)
+
+    headers = []
+    with open(path, "rb") as f:
+        version, device_id, blocksize, reserved = np.frombuffer(f.read(file_header_size), dtype="int16")
+
+        last_position = max(file_size - window, file_header_size)
+        positions = np.unique(np.linspace(file_header_size, last_position, max(samples, 2)).astype("int64"))
+        for position in positions:
+            f.seek(position)
+            data = np.frombuffer(f.read(window), dtype="uint8")
+            headers.append(_window_headers(data, int(position), frame_dtype))
+
+    headers = np.concatenate(headers)
+    #Windows may overlap in small files
+    headers = headers[np.unique(headers["first_byte"], return_index=True)[1]]
+
+    if len(headers) == 0:
+        return(ProbeResult(path, extension.lower(), int(version), int(device_id), int(blocksize), [], 0, None, None, None))
+
+    codes = np.unique(headers["survey_type"])
+    channels = [name for code, name in survey_types.items() if code in codes]
+    frames = int(round((file_size - file_header_size) / headers["frame_size"].mean()))
+
+    #Datetimes are relative to the hardware time of the first frame in the file
+    time_start = int(headers["hardware_time"][0]) * 1000
+    start_time = np.datetime64(time_start + int(headers["seconds"][0]), "ms")
+    end_time = np.datetime64(time_start + int(headers["seconds"][-1]), "ms")
+
+    located = (headers["x"] != 0) | (headers["y"] != 0)
+    bbox = None
+    if located.any():
+        longitude = _x2lon(headers["x"][located].astype("float64"))
+        latitude = _y2lat(headers["y"][located].astype("float64"))
+        bbox = (float(longitude.min()), float(latitude.min()), float(longitude.max()), float(latitude.max()))
+
+    return(ProbeResult(path, extension.lower(), int(version), int(device_id), int(blocksize), channels, frames, start_time, end_time, bbox))
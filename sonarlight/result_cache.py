@@ -0,0 +1,96 @@
+#Definition of ResultCache class
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+def _result_bytes(result, owners: list = ()) -> int:
+    #Arrays sharing memory with the "owners" arrays, e.g. images viewing the stored pixels of a channel, 
+    #and views of non-array buffers, e.g. a mapped file, are not charged, as removing them from the cache does not free memory
+    if isinstance(result, np.ndarray):
+        root = result
+        while isinstance(root.base, np.ndarray):
+            root = root.base
+        if root.base is not None or any(np.shares_memory(result, owner) for owner in owners):
+            return(0)
+        return(result.nbytes)
+    if isinstance(result, pd.DataFrame):
+        return(int(result.memory_usage(index=True).sum()))
+    return(0)
+
+class ResultCache:
+    '''
+    Thread-safe least recently used cache of extracted arrays and dataframes, limited to "max_bytes" bytes.
+
+    Results are computed from a "source" object, e.g. the dataframe of a Sonar object, and the cache is emptied when the source changes.
+    Cached arrays are read-only as they are shared between callers.
+    Results sharing memory with the "owners" arrays given to "put", e.g. images viewing the stored pixels, count as 0 bytes towards "max_bytes".
+    '''
+
+    def __init__(self, max_bytes: int = 2**29):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._source = None
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, source):
+        '''Cached result of a key, None if missing or computed from another source'''
+
+        with self._lock:
+            if self._source is not source or key not in self._entries:
+                self.misses += 1
+                return(None)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return(self._entries[key][0])
+
+    def put(self, key, result, source, owners: list = ()):
+        '''Cache a result computed from a source, removing the least recently used results to stay within "max_bytes".
+        Results sharing memory with the "owners" arrays are not charged'''
+
+        nbytes = _result_bytes(result, owners)
+        if nbytes > self.max_bytes:
+            return
+
+        if isinstance(result, np.ndarray):
+            result.flags.writeable = False
+
+        with self._lock:
+            if self._source is not source:
+                self._clear()
+                self._source = source
+
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, nbytes)
+            self.nbytes += nbytes
+
+            while self.nbytes > self.max_bytes:
+                _, (_, old_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= old_nbytes
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def _clear(self):
+        self._entries.clear()
+        self._source = None
+        self.nbytes = 0
+
+    def __getstate__(self) -> dict:
+        #Locks cannot be pickled, so results are not copied, e.g. when returning Sonar objects from worker processes
+        return({"max_bytes": self.max_bytes})
+
+    def __setstate__(self, state: dict):
+        self.__init__(state["max_bytes"])
+
+    def __len__(self) -> int:
+        return(len(self._entries))
+
+    def __repr__(self) -> str:
+        return(f"ResultCache with {len(self)} results of {self.nbytes} bytes (max {self.max_bytes} bytes)")
@@ -3,101 +3,141 @@
 import numpy as np
 import pandas as pd
 import math
+import os
+import time
+import asyncio
+import functools
+import logging
+import tracemalloc
+from .echo_store import EchoStore, _gather_pings
+from .formats import sl2_frame_dtype, sl3_frame_dtype, survey_types, supported_channels, _survey_codes, _frame_offsets, _frame_headers, _x2lon, _y2lat
+from .cache import read_cache, write_cache, cached_attributes
+from .result_cache import ResultCache
+from . import export
 
-#dtype for '.sl2' files (144 bytes)
-sl2_frame_dtype = np.dtype([
-    ("first_byte", "<u4"),
-    ("frame_version", "<u4"),
-    ("unknown8", "<f4"),
-    ("unknown12", "<f4"),
-    ("unknown16", "<f4"),
-    ("unknown20", "<f4"),
-    ("unknown24", "<f4"),
-    ("frame_size", "<u2"),
-    ("prev_frame_size", "<u2"),
-    ("survey_type", "<u2"),
-    ("packet_size", "<u2"),
-    ("id", "<u4"),
-    ("min_range", "<f4"),
-    ("max_range", "<f4"),
-    ("unknown48", "<f4"),
-    ("unknown52", "<u1"),
-    ("frequency_type", "<u2"),
-    ("unknown55", "<u1"),
-    ("unknown56", "<f4"),
-    ("hardware_time", "<u4"),
-    ("water_depth", "<f4"),
-    ("unknown68", "<f4"),
-    ("unknown72", "<f4"),
-    ("unknown76", "<f4"),
-    ("unknown80", "<f4"),
-    ("unknown84", "<f4"),
-    ("unknown88", "<f4"),
-    ("unknown92", "<f4"),
-    ("unknown96", "<f4"),
-    ("gps_speed", "<f4"),
-    ("water_temperature", "<f4"),
-    ("x", "<i4"),
-    ("y", "<i4"),
-    ("water_speed", "<f4"),
-    ("gps_heading", "<f4"),
-    ("gps_altitude", "<f4"),
-    ("magnetic_heading", "<f4"),
-    ("flags", "<u2"),
-    ("unknown132", "<u2"),
-    ("unknown136", "<f4"),
-    ("seconds", "<u4")
-])
-
-#dtype for '.sl3' files (168 bytes)
-sl3_frame_dtype = np.dtype([
-    ("first_byte", "<u4"),
-    ("frame_version", "<u4"),
-    ("frame_size", "<u2"),
-    ("prev_frame_size", "<u2"),
-    ("survey_type", "<u2"),
-    ("unknown14", "<i2"),
-    ("id", "<u4"),
-    ("min_range", "<f4"),
-    ("max_range", "<f4"),
-    ("unknown28", "<f4"),
-    ("unknown32", "<f4"),
-    ("unknown36", "<f4"),
-    ("hardware_time", "<u4"),
-    ("echo_size", "<u4"),
-    ("water_depth", "<f4"),
-    ("frequency_type", "<u2"),
-    ("unknown54", "<f4"),
-    ("unknown58", "<f4"),
-    ("unknown62", "<i2"),
-    ("unknown64", "<f4"),
-    ("unknown68", "<f4"),
-    ("unknown72", "<f4"),
-    ("unknown76", "<f4"),
-    ("unknown80", "<f4"),
-    ("gps_speed", "<f4"),
-    ("water_temperature", "<f4"),
-    ("x", "<i4"),
-    ("y", "<i4"),
-    ("water_speed", "<f4"),
-    ("gps_heading", "<f4"),
-    ("gps_altitude", "<f4"),
-    ("magnetic_heading", "<f4"),
-    ("flags", "<u2"),
-    ("unknown118", "<u2"),
-    ("unknown120", "<u4"),
-    ("seconds", "<u4"), #milliseconds
-    ("prev_primary_offset", "<u4"),
-    ("prev_secondary_offset", "<u4"),
-    ("prev_downscan_offset", "<u4"),
-    ("prev_left_sidescan_offset", "<u4"),
-    ("prev_right_sidescan_offset", "<u4"),
-    ("prev_sidescan_offset", "<u4"),
-    ("unknown152", "<u4"),
-    ("unknown156", "<u4"),
-    ("unknown160", "<u4"),
-    ("prev_3d_offseft", "<u4")
-])
+logger = logging.getLogger("sonarlight")
+logger.addHandler(logging.NullHandler())
+
+def _categorical(types: np.ndarray, names: dict) -> pd.Categorical:
+    '''Categorical of the names of integer type codes, "unknown" for codes without a name.
+    All names are categories, so categoricals of different files and chunks have the same categories'''
+
+    categories = list(dict.fromkeys(list(names.values()) + ["unknown"]))
+    lookup = np.full(max(list(names) + [int(types.max()) if len(types) > 0 else 0]) + 1, categories.index("unknown"), dtype="int8")
+    lookup[list(names)] = [categories.index(i) for i in names.values()]
+    return(pd.Categorical.from_codes(lookup[types], categories))
+
+def _pool_blocks(values: np.ndarray, factor: int, ufunc: np.ufunc) -> np.ndarray:
+    #Reduce blocks of factor x factor pixels of a matrix with dimensions divisible by "factor" using a binary ufunc,
+    #combining strided slices which is faster than reducing a reshaped array
+    rows = functools.reduce(ufunc, [values[i::factor] for i in range(factor)])
+    return(functools.reduce(ufunc, [rows[:, i::factor] for i in range(factor)]))
+
+def _augment_coordinates(longitude: np.ndarray, latitude: np.ndarray, speed: np.ndarray, seconds: np.ndarray, 
+                         heading: np.ndarray, primary: np.ndarray, lim: float = 1.2) -> tuple:
+    '''Coordinate augmentation as implemented in https://github.com/halmaia/SL3Reader.
+
+    The position is dead-reckoned from the speed and heading of consecutive frames and clamped to within "lim" meters
+    of the recorded coordinates for primary/secondary frames and reset to the recorded coordinates if more than 50 meters off for other frames.
+    Velocity components and latitude steps are computed for all frames with NumPy, leaving only the clamped recurrence in the loop'''
+
+    direction = math.tau - heading + (math.pi / 2)
+    v_longitude = np.cos(direction) * speed
+    v_latitude = np.sin(direction) * speed
+    dt = np.diff(seconds)
+
+    latitude_step = (dt * 0.5 * (v_latitude[:-1] + v_latitude[1:]) * 180 / (math.pi * 6356752.3142)).tolist()
+    longitude_step = (dt * 0.5 * (v_longitude[:-1] + v_longitude[1:]) * 180).tolist()
+    lat_lim = math.degrees(lim / 6356752.3142)
+
+    longitude_list = longitude.tolist()
+    latitude_list = latitude.tolist()
+    primary_list = primary.tolist()
+    longitude_augmented = longitude_list.copy()
+    latitude_augmented = latitude_list.copy()
+    longitude0 = longitude_list[0] if longitude_list else 0.0
+    latitude0 = latitude_list[0] if latitude_list else 0.0
+
+    for i in range(1, len(longitude_list)):
+        latitude0 += latitude_step[i-1]
+        cos_latitude0 = math.cos(math.radians(latitude0))
+        longitude0 += longitude_step[i-1] / (math.pi * cos_latitude0 * 6356752.3142)
+        
+        longitude_i = longitude_list[i]
+        latitude_i = latitude_list[i]
+
+        if primary_list[i]:
+            if math.radians(abs(latitude_i - latitude0)) * 6356752.3142 > lim:
+                latitude0 = latitude_i + math.copysign(lat_lim, latitude0 - latitude_i)
+                cos_latitude0 = math.cos(math.radians(latitude0))
+
+            if math.radians(abs(longitude_i - longitude0)) * (6356752.3142 * cos_latitude0) > lim:
+                longitude0 = longitude_i + math.copysign(math.degrees(lim / (6356752.3142 * cos_latitude0)), longitude0 - longitude_i)
+        else:
+            if math.radians(abs(latitude_i - latitude0)) * 6356752.3142 > 50:
+                latitude0 = latitude_i
+                cos_latitude0 = math.cos(math.radians(latitude0))
+
+            if math.radians(abs(longitude_i - longitude0)) * (6356752.3142 * cos_latitude0) > 50:
+                longitude0 = longitude_i
+
+        longitude_augmented[i] = longitude0
+        latitude_augmented[i] = latitude0
+
+    return(np.array(longitude_augmented), np.array(latitude_augmented))
+
+class _FrameReader:
+    '''
+    Incremental reader of complete frames from an open '.sl2' or '.sl3' file.
+
+    Each call to "read" parses the frames following the last frame returned by the previous call.
+    Bytes of a frame that is not yet complete are kept until more data has been read from the file.
+    As when reading a whole file, a frame is only returned when more data follows it.
+    '''
+
+    def __init__(self, f, frame_dtype: np.dtype, file_header_size: int = 8, block_size: int = 2**22):
+        self.f = f
+        self.frame_dtype = frame_dtype
+        self.frame_size_offset = frame_dtype.fields["frame_size"][1]
+        self.block_size = block_size
+        self.position = file_header_size #file position of the first byte in "pending"
+        self.frames_read = 0
+        self.pending = bytearray()
+
+        self.f.seek(file_header_size)
+
+    def read(self, max_frames: int):
+        '''Return a buffer with up to "max_frames" frames, the position of the buffer in the file and the frame offsets in the buffer.
+        The file is read until "max_frames" frames are found or the end of the file is reached'''
+
+        while True:
+            offsets = _frame_offsets(self.pending, self.frame_dtype.itemsize, self.frame_size_offset)
+            if len(offsets) >= max_frames:
+                break
+            
+            read_size = self.block_size
+            if len(offsets) > 1:
+                mean_frame_size = offsets[-1] // (len(offsets) - 1)
+                read_size = max(read_size, int(mean_frame_size * (max_frames - len(offsets) + 1)))
+            block = self.f.read(read_size)
+            if not block:
+                break
+            self.pending += block
+
+        offsets = offsets[:max_frames]
+        if len(offsets) == 0:
+            return(b"", self.position, offsets)
+        
+        last_frame_size = int(np.frombuffer(self.pending, dtype="<u2", count=1, offset=int(offsets[-1]) + self.frame_size_offset)[0])
+        end = int(offsets[-1]) + last_frame_size
+        buffer = bytes(self.pending[:end])
+        buffer_position = self.position
+
+        del self.pending[:end]
+        self.position += end
+        self.frames_read += len(offsets)
+
+        return(buffer, buffer_position, offsets)
 
 class Sonar:
     '''
@@ -106,21 +146,76 @@ class Sonar:
     Arguments:
     clean = True - (True is default) - Perform basic data cleaning including dropping unknown columns and rows and observation where the water depth is 0.
     augment_coords = True - (False is default) - Perform coordinate augmentation as implemented in https://github.com/halmaia/SL3Reader.
+    mmap = True - (False is default) - Memory-map the file instead of reading it into memory. Frame headers are read directly from the mapped file and the pixels of a channel are copied into memory once when the channel is first used. Images of channels with equally long and evenly spaced pings, e.g. logs with a fixed order of channels, are views of the mapped file without copying.
+    channels = ["sidescan"] - (None is default) - Only decode frames of these channels. All frames are decoded by default.
+    columns = ["survey", "datetime", ...] - (None is default) - Only compute and keep these columns in the dataframe. The "survey" column is always kept. Note that extraction methods depend on some columns, e.g. "bottom_index" and "water_depth" for water().
+    load_echoes = False - (True is default) - Skip storing the pixels. Only the frame headers are read from the file, so data for navigation etc. can be loaded much faster.
+    cache_dir = "path/to/cache" - (None is default) - Cache the decoded data in this directory. Loading the same file with the same options again reads the cache instead, with pixels memory-mapped from the cache files.
+    cache_size = 10*2**30 - (10 GB is default) - Maximum size of the cache in bytes. The least recently used files are removed from the cache when it grows larger.
+    compact = True - (False is default) - Keep a compact dataframe with only the named frame header fields in their native narrow dtypes. Fields of unknown meaning ("unknown8", ...) are only added if listed in "columns", and the raw frame headers of all fields remain available in "headers".
+    profile = True - (False is default) - Record wall time, bytes read, frames and peak allocation of each stage of reading the file in the "stats" dictionary.
+    Stages are also logged to the "sonarlight" logger at INFO level. Peak allocation is traced with tracemalloc, which adds some overhead to the wall time. If tracemalloc is already tracing, its peak is not reset and "peak_bytes" is the increase of that peak during a stage.
+
+    Pixels of each channel are stored contiguously in an EchoStore in the "echoes" dictionary, e.g. sonar.echoes["primary"].
+
+    Extraction methods only read the dataframe and pixels, so they can be called from several threads at once.
+    The asynchronous versions (aimage(), awater(), abottom(), abottom_intensity() and asidescan_xyz()) run in the thread pool "executor"
+    (the default executor of the event loop if None) and keep recent results in "result_cache", a ResultCache limited to 512 MB by default.
     '''
     
-    def __init__(self, path: str, clean: bool = True, augment_coords: bool = False):
+    def __init__(self, path: str, clean: bool = True, augment_coords: bool = False, mmap: bool = False, 
+                 channels: list = None, columns: list = None, load_echoes: bool = True, 
+                 cache_dir: str = None, cache_size: int = 10*2**30, compact: bool = False, profile: bool = False):
+        self._setup(path, clean, augment_coords, mmap, channels, columns, load_echoes, compact)
+        self.cache_dir = cache_dir
+        self.cache_size = cache_size
+        self.profile = profile
+        start = time.perf_counter()
+
+        cached = self._stage("read_cache", read_cache, self) if cache_dir is not None else False
+
+        if not cached:
+            self._stage("read_bin", self._read_bin)
+            self._parse_header()
+            self._stage("decode", self._decode)
+            self._build()
+            if cache_dir is not None:
+                self._stage("write_cache", write_cache, self)
+
+        if self.profile:
+            self.stats["total"] = {"seconds": time.perf_counter() - start, "bytes_read": self.bytes_read, "frames": self.df.shape[0],
+                                   "peak_bytes": max(i["peak_bytes"] for i in self.stats.values())}
+            logger.info(f"Read {self.path} in {self.stats['total']['seconds']:.3f} s", 
+                        extra={"sonarlight_path": self.path, "sonarlight_stage": "total", "sonarlight_stats": self.stats["total"]})
+
+    def _setup(self, path: str, clean: bool, augment_coords: bool, mmap: bool, 
+               channels: list = None, columns: list = None, load_echoes: bool = True, compact: bool = False):
         self.path = path
+        self.cache_dir = None
+        self.clean = clean
+        self.mmap = mmap
+        self.channels = channels
+        self.columns = columns
+        self.load_echoes = load_echoes
+        self.compact = compact
+        self.hardware_time_start = None
+        self._rows_cache = (None, None, {})
+        self.result_cache = ResultCache()
+        self.executor = None
+        self.profile = False
+        self.stats = {}
+        self.bytes_read = 0
         self.file_header_size = 8
+        self.buffer_offset = self.file_header_size
         self.extension = path.split(".")[-1]
         self.frame_header_size = 168 if "sl3" in self.extension else 144
         self.frame_dtype = sl3_frame_dtype if "sl3" in self.extension else sl2_frame_dtype
 
-        self.supported_channels = ["primary", "secondary", "downscan", "sidescan"]
+        self.supported_channels = list(supported_channels)
         self.valid_channels = []
         self.valid_channels_records = []
         
-        self.survey_dict = {0: 'primary', 1: 'secondary', 2: 'downscan',
-                            3: 'left_sidescan', 4: 'right_sidescan', 5: 'sidescan'}
+        self.survey_dict = dict(survey_types)
         
         self.frequency_dict = {0: "200kHz", 1: "50kHz", 2: "83kHz",
                                3: "455kHz", 4: "800kHz", 5: "38kHz", 
@@ -131,133 +226,347 @@ class Sonar:
                              "x", "y", "longitude", "latitude", 
                              "min_range", "max_range", "water_depth", 
                              "gps_speed", "gps_heading", "gps_altitude", 
-                             "bottom_index", "frames"]
+                             "bottom_index"]
         
         self.augment_coords = augment_coords
         if augment_coords:
             self.vars_to_keep = self.vars_to_keep + ["longitude_augmented", "latitude_augmented", "x_augmented", "y_augmented"]
 
-        self._read_bin()
-        self._parse_header()
-        self._decode()
-        self._process()
-        self._valid_channels()
+        if columns is not None:
+            self.vars_to_keep = list(columns) if "survey" in columns else ["survey"] + list(columns)
 
-        if augment_coords:
-            self._coordinate_augmentation()
+        if channels is not None:
+            self._survey_types(channels)
 
-        if clean:
-            self._select()
-            self._drop_zero_depth()
-            self._drop_unknown_channels()
+    def _build(self):
+        self._stage("process", self._process)
+
+        if self.augment_coords:
+            #Augmentation uses all frames, so channels are only selected afterwards
+            self._stage("coordinate_augmentation", self._coordinate_augmentation)
+            self._select_channels()
+
+        self._stage("clean", self._clean)
             
+        if self.load_echoes:
+            self._stage("store_echoes", self._store_echoes)
+        else:
+            self.echoes = {}
+
         self._describe()
 
+    def _clean(self):
+        self._valid_channels()
+
+        if self.clean:
+            self._drop_zero_depth()
+            self._drop_unknown_channels()
+
+        if self.clean or self.columns is not None:
+            self._select()
+
+    def _stage(self, name: str, fun, *args):
+        #Run a stage of reading the file, recording wall time, bytes read, frames and peak allocation if profiling
+        if not self.profile:
+            return(fun(*args))
+
+        #Tracing started by the caller is left running with its peak untouched
+        tracing = tracemalloc.is_tracing()
+        if not tracing:
+            tracemalloc.start()
+        memory_start, peak_start = tracemalloc.get_traced_memory()
+        bytes_start = self.bytes_read
+        start = time.perf_counter()
+
+        result = fun(*args)
+
+        seconds = time.perf_counter() - start
+        peak_end = tracemalloc.get_traced_memory()[1]
+        if tracing:
+            #Without resetting the peak, only the increase of the caller's peak during the stage is known
+            peak_bytes = peak_end - peak_start
+        else:
+            peak_bytes = peak_end - memory_start
+            tracemalloc.stop()
+
+        stats = {"seconds": seconds, "bytes_read": self.bytes_read - bytes_start, 
+                 "frames": self.df.shape[0] if hasattr(self, "df") else 0, "peak_bytes": peak_bytes}
+        self.stats[name] = stats
+        logger.info(f"{name} of {self.path}: {seconds:.3f} s, {stats['frames']} frames, {stats['bytes_read']} bytes read, {peak_bytes} bytes peak allocation",
+                    extra={"sonarlight_path": self.path, "sonarlight_stage": name, "sonarlight_stats": stats})
+
+        return(result)
+
+    @classmethod
+    def iter_chunks(cls, path: str, frames_per_chunk: int = 10000, channels: list = None, clean: bool = True):
+        '''
+        Read a file incrementally, yielding a Sonar object for each chunk of frames.
+
+        Only one chunk of frames is held in memory at a time, allowing files larger than memory to be processed.
+        Frames are parsed and converted as when reading the whole file and the dataframe row labels are frame numbers in the file.
+        Coordinate augmentation is not available when reading in chunks.
+
+        Arguments:
+        frames_per_chunk - Number of frames read per chunk, before selecting channels.
+        channels - List of channels to keep, e.g. ["sidescan"]. All channels are kept by default.
+        clean = True - (True is default) - Perform basic data cleaning on each chunk.
+        '''
+
+        with open(path, "rb") as f:
+            template = cls.__new__(cls)
+            template._setup(path, clean, False, False)
+            header = f.read(template.file_header_size)
+            reader = _FrameReader(f, template.frame_dtype, template.file_header_size)
+            hardware_time_start = None
+
+            while True:
+                chunk_sonar = cls._read_chunk(path, header, reader, frames_per_chunk, hardware_time_start, channels, clean)
+                if chunk_sonar is None:
+                    break
+                hardware_time_start = chunk_sonar.hardware_time_start
+
+                if chunk_sonar.df.shape[0] > 0:
+                    chunk_sonar._build()
+                    yield(chunk_sonar)
+
+    @classmethod
+    def follow(cls, path: str, poll_interval: float = 1.0, timeout: float = None, from_start: bool = True,
+               frames_per_chunk: int = 10000, channels: list = None, clean: bool = True):
+        '''
+        Follow a file that is still being recorded, yielding a Sonar object with the frames appended since the previous poll.
+
+        The file is checked for new data every "poll_interval" seconds and only the newly appended frames are parsed.
+        Incomplete frames at the end of the file are kept until the rest of the frame has been written.
+        As when reading a whole file, a frame is only returned when more data follows it, so the newest frame is returned on a later poll.
+        Frames are parsed and converted as when reading the whole file and the dataframe row labels are frame numbers in the file.
+        Coordinate augmentation is not available when following a file.
+
+        Arguments:
+        poll_interval - Seconds between checks for new data.
+        timeout - Stop when no new frames have been appended for this many seconds. Follows the file until the loop is stopped by default.
+        from_start = True - (True is default) - Yield the frames already in the file first, otherwise only frames appended from now on.
+        frames_per_chunk - Maximum number of frames per yielded Sonar object, before selecting channels.
+        channels - List of channels to keep, e.g. ["sidescan"]. All channels are kept by default.
+        clean = True - (True is default) - Perform basic data cleaning on each chunk.
+        '''
+
+        with open(path, "rb") as f:
+            template = cls.__new__(cls)
+            template._setup(path, clean, False, False)
+            header = f.read(template.file_header_size)
+            reader = _FrameReader(f, template.frame_dtype, template.file_header_size)
+            hardware_time_start = None
+
+            if not from_start:
+                #Skip the frames already in the file, keeping the time of the first frame for datetimes
+                while True:
+                    buffer, _, offsets = reader.read(frames_per_chunk)
+                    if len(offsets) == 0:
+                        break
+                    if hardware_time_start is None:
+                        hardware_time_start = _frame_headers(buffer, offsets[:1], template.frame_dtype)["hardware_time"][0]
+
+            last_data = time.monotonic()
+
+            while True:
+                chunk_sonar = cls._read_chunk(path, header, reader, frames_per_chunk, hardware_time_start, channels, clean)
+
+                if chunk_sonar is None:
+                    if timeout is not None and time.monotonic() - last_data >= timeout:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                last_data = time.monotonic()
+                hardware_time_start = chunk_sonar.hardware_time_start
+
+                if chunk_sonar.df.shape[0] > 0:
+                    chunk_sonar._build()
+                    yield(chunk_sonar)
+
+    @classmethod
+    def _read_chunk(cls, path: str, header: bytes, reader: _FrameReader, max_frames: int, 
+                    hardware_time_start: int, channels: list, clean: bool):
+        #Decode the next frames of an incremental reader into a Sonar object, None if no complete frames are available
+        first_label = reader.frames_read
+        buffer, buffer_position, offsets = reader.read(max_frames)
+        if len(offsets) == 0:
+            return(None)
+
+        chunk_sonar = cls.__new__(cls)
+        chunk_sonar._setup(path, clean, False, False, channels)
+        chunk_sonar.hardware_time_start = hardware_time_start
+        chunk_sonar.header = header
+        chunk_sonar.buffer = buffer
+        chunk_sonar.buffer_offset = buffer_position
+        chunk_sonar._parse_header()
+        chunk_sonar._decode(offsets, first_label)
+
+        return(chunk_sonar)
+
+    @classmethod
+    def from_export(cls, path: str, columns: list = None, load_echoes: bool = True, filters: list = None):
+        '''
+        Load a Sonar object from a file written by to_npz() or to_parquet() without decoding the original file.
+
+        Arguments:
+        columns - List of columns to read into the dataframe. All exported columns are read by default.
+        load_echoes = True - (True is default) - Read the pixels. Pixels of Parquet exports are only split into channels when first used.
+        filters - Row filters passed to pyarrow.parquet.read_table, e.g. [("survey", "==", "sidescan")], so only matching row groups are read (Parquet only).
+        '''
+
+        df, echoes, meta = export.read_export(path, columns, load_echoes, filters)
+
+        sonar = cls.__new__(cls)
+        sonar._setup(meta["source_path"], meta["clean"], meta["augment_coords"], False, 
+                     meta["channels"], columns if columns is not None else meta["columns"], load_echoes)
+        
+        for name in cached_attributes:
+            setattr(sonar, name, meta["attributes"][name])
+
+        sonar.path = path
+        sonar.df = df
+        sonar.buffer = None
+
+        #Channels are found from the loaded rows, as filters may have left out channels of the export
+        sonar.valid_channels_records = []
+        sonar._valid_channels()
+        sonar._describe()
+        sonar.echoes = {channel: echoes[channel] for channel in sonar.valid_channels if channel in echoes}
+
+        return(sonar)
+
+    @staticmethod
+    def open_index(path: str, sidecar: bool = True):
+        '''
+        Open the FrameIndex of a file for reading only the frames of a time window, an area or a channel, e.g.
+        Sonar.open_index(path).read(time_range=("2023-09-13 08:21", "2023-09-13 08:22"), channel="sidescan").
+
+        The index is saved in a sidecar file next to the file ('.index.npz') and is rebuilt if the file changes.
+        Set sidecar=False to build the index without reading or writing the sidecar file.
+        '''
+
+        from .frame_index import FrameIndex
+        return(FrameIndex.open(path, sidecar))
+
     def _read_bin(self):
-        with open(self.path, "rb") as f:
-            blob = f.read()
-        self.header = blob[:self.file_header_size]
+        if self.mmap or not self.load_echoes:
+            #Pixels are copied from the mapped file when a channel is first used, 
+            #and only the pages holding frame headers are read if pixels are not loaded
+            blob = np.memmap(self.path, dtype="uint8", mode="r")
+            self.header = blob[:self.file_header_size].tobytes()
+            self.bytes_read += self.file_header_size
+        else:
+            with open(self.path, "rb") as f:
+                blob = f.read()
+            self.header = blob[:self.file_header_size]
+            self.bytes_read += len(blob)
         self.buffer = blob[self.file_header_size:]
     
     def _parse_header(self):
         self.version, self.device_id, self.blocksize, self.reserved = np.frombuffer(self.header, dtype="int16")
         
-    def _decode(self):
-        position = 0
-        frame_header_list = []
-        frame_size_slice = slice(8, 10) if "sl3" in self.extension else slice(28, 30)
-
-        while (position < len(self.buffer)):
-            frame_head = self.buffer[position:(position+self.frame_header_size)]
-            frame_size = int.from_bytes(frame_head[frame_size_slice], "little", signed = False)
-            
-            position += frame_size
-            
-            if(position < len(self.buffer)):
-                frame_header_list.append(frame_head)
+    def _decode(self, offsets: np.ndarray = None, first_label: int = 0, labels: np.ndarray = None):
+        if offsets is None:
+            frame_size_offset = self.frame_dtype.fields["frame_size"][1]
+            offsets = _frame_offsets(self.buffer, self.frame_header_size, frame_size_offset)
         
-        self.df = pd.DataFrame(np.frombuffer(b''.join(frame_header_list), dtype=self.frame_dtype))
+        headers = _frame_headers(self.buffer, offsets, self.frame_dtype)
+        if isinstance(self.buffer, np.memmap):
+            #Only the frame headers are read from a memory-mapped file
+            self.bytes_read += headers.nbytes
+        index = pd.RangeIndex(first_label, first_label + len(headers)) if labels is None else pd.Index(labels)
+
+        #Datetimes are relative to the hardware time of the first frame in the file
+        if self.hardware_time_start is None and len(headers) > 0:
+            self.hardware_time_start = headers["hardware_time"][0]
+
+        if self.channels is not None and not self.augment_coords:
+            keep = np.isin(headers["survey_type"], self._survey_types(self.channels))
+            headers = headers[keep]
+            index = index[keep]
+
+        if self.compact:
+            #Only named fields are copied into the dataframe, fields of unknown meaning only if selected
+            fields = [i for i in self.frame_dtype.names if not i.startswith("unknown") or (self.columns is not None and i in self.columns)]
+            self.df = pd.DataFrame({i: headers[i] for i in fields}, index=index)
+        else:
+            self.df = pd.DataFrame(headers, index=index)
+
         self.df["first_byte_no_offset"] = self.df["first_byte"] - self.file_header_size
-        self.df["frames"] = [np.frombuffer(self.buffer[(i+self.frame_header_size):(i+p)], dtype="uint8") for i, p in zip(self.df["first_byte_no_offset"], self.df["frame_size"])]        
+        #Pixel positions in the buffer for each row, used when storing the pixels of each channel
+        self._echo_starts = pd.Series(self.df["first_byte"].to_numpy().astype("int64") - self.buffer_offset + self.frame_header_size, index=index)
+        self._echo_lengths = pd.Series(self.df["frame_size"].to_numpy().astype("int64") - self.frame_header_size, index=index)
+
+    @property
+    def headers(self) -> np.ndarray:
+        '''Raw frame headers of the rows of the dataframe as a structured array with all fields of the frame dtype.
+        Headers are gathered from the file buffer when accessed, so they are not available for cached or exported data'''
+
+        if self.buffer is None:
+            raise ValueError("Raw frame headers are not available for data loaded from a cache or export")
+
+        offsets = self._echo_starts.loc[self.df.index].to_numpy() - self.frame_header_size
+        return(_frame_headers(self.buffer, offsets, self.frame_dtype))
+
+    def _select_channels(self):
+        if self.channels is not None:
+            self.df = self.df[self.df["survey_type"].isin(self._survey_types(self.channels))]
+
+    def _survey_types(self, channels: list) -> list:
+        return(_survey_codes(channels))
         
     def _x2lon(self, x):
-        return(x/6356752.3142*(180/math.pi))
+        return(_x2lon(x))
 
     def _y2lat(self, y):
-        return(((2*np.arctan(np.exp(y/6356752.3142)))-(math.pi/2))*(180/math.pi))
+        return(_y2lat(y))
 
     def _lon2x(self, lon):
         return(lon * (math.pi / 180) * 6356752.3142)
 
     def _lat2y(self, lat):
-        return(math.log(math.tan((lat * (math.pi / 180) + (math.pi / 2)) / 2)) * 6356752.3142)
+        return(np.log(np.tan((lat * (math.pi / 180) + (math.pi / 2)) / 2)) * 6356752.3142)
     
     def _bottom_index(self):
-        frame_len = np.array([len(i) for i in self.df["frames"]])
+        frame_len = self.df["frame_size"].astype("int64") - self.frame_header_size
         frame_bottom_index = ((frame_len/(self.df["max_range"]-self.df["min_range"]))*self.df["water_depth"]).astype("int32")
         return(frame_bottom_index)
     
     def _process(self):
         self.df[["water_depth", "min_range", "max_range", "gps_altitude"]] /= 3.2808399 #feet to meter
         self.df["gps_speed"] *=  0.5144 #knots to m/s
-        self.df["survey"] = [self.survey_dict.get(i, "unknown") for i in self.df["survey_type"]]
-        self.df["frequency"] = [self.frequency_dict.get(i, "unknown") for i in self.df["frequency_type"]]
+        self.df["survey"] = _categorical(self.df["survey_type"].to_numpy(), self.survey_dict)
         self.df["seconds"] /= 1000 #milliseconds to seconds
-        hardware_time_start = self.df["hardware_time"][0]
-        self.df["datetime"] = pd.to_datetime(hardware_time_start+self.df["seconds"], unit='s')
-        self.df["bottom_index"] = self._bottom_index()
-        self.frame_version = self.df["frame_version"].iloc[0]
-        self.df["longitude"] = self._x2lon(self.df["x"])
-        self.df["latitude"] = self._y2lat(self.df["y"])
+        self.frame_version = self.df["frame_version"].iloc[0] if self.df.shape[0] > 0 else None
 
-    def _coordinate_augmentation(self):
-        self.df['longitude_augmented'] = self.df['longitude']
-        self.df['latitude_augmented'] = self.df['latitude']
-
-        longitude0 = self.df.loc[0, 'longitude']
-        latitude0 = self.df.loc[0, 'latitude']
-        v0 = self.df.loc[0, 'gps_speed']
-        t0 = self.df.loc[0, 'seconds']
-        d0 = math.tau - self.df.loc[0, 'gps_heading'] + (math.pi / 2)
-        lim = 1.2
-
-        for i in range(1, len(self.df)):
-            t1 = self.df.loc[i, 'seconds']
-            v1 = self.df.loc[i, 'gps_speed']
-            d1 = math.tau - self.df.loc[i, 'gps_heading'] + (math.pi / 2)
-
-            dt = t1 - t0
-            v_longitude0 = math.cos(d0) * v0
-            v_latitude0 = math.sin(d0) * v0
-            v_longitude1 = math.cos(d1) * v1
-            v_latitude1 = math.sin(d1) * v1
-
-            latitude0 += dt * 0.5 * (v_latitude0 + v_latitude1) * 180 / (math.pi * 6356752.3142)
-            longitude0 += dt * 0.5 * (v_longitude0 + v_longitude1) * 180 / (math.pi * math.cos(math.radians(latitude0)) * 6356752.3142)
-
-            d0, t0, v0 = d1, t1, v1
-
-            if self.df.loc[i, 'survey_type'] in [0, 1]:
-                dy = self.get_latitude_distance(latitude0, self.df.loc[i, 'latitude'])
-                if abs(dy) > lim:
-                    latitude0 = self.df.loc[i, 'latitude'] + math.copysign(math.degrees(lim / 6356752.3142), latitude0 - self.df.loc[i, 'latitude'])
-
-                dx = self.get_longitude_distance(longitude0, self.df.loc[i, 'longitude'], latitude0)
-                if abs(dx) > lim:
-                    longitude0 = self.df.loc[i, 'longitude'] + math.copysign(math.degrees(lim / (6356752.3142 * math.cos(math.radians(latitude0)))), longitude0 - self.df.loc[i, 'longitude'])
-            else:
-                dy = self.get_latitude_distance(latitude0, self.df.loc[i, 'latitude'])
-                if abs(dy) > 50:
-                    latitude0 = self.df.loc[i, 'latitude']
+        #Derived columns are skipped when not among the selected columns
+        if self._computed("frequency"):
+            self.df["frequency"] = _categorical(self.df["frequency_type"].to_numpy(), self.frequency_dict)
+        if self._computed("datetime"):
+            self.df["datetime"] = pd.to_datetime(self.hardware_time_start+self.df["seconds"], unit='s')
+        if self._computed("bottom_index"):
+            self.df["bottom_index"] = self._bottom_index()
+        if self._computed("longitude"):
+            self.df["longitude"] = self._x2lon(self.df["x"])
+        if self._computed("latitude"):
+            self.df["latitude"] = self._y2lat(self.df["y"])
 
-                dx = self.get_longitude_distance(longitude0, self.df.loc[i, 'longitude'], latitude0)
-                if abs(dx) > 50:
-                    longitude0 = self.df.loc[i, 'longitude']
+    def _computed(self, column: str) -> bool:
+        return(self.columns is None or column in self.columns or (self.augment_coords and column in ["longitude", "latitude"]))
 
-            self.df.loc[i, 'longitude_augmented'] = longitude0
-            self.df.loc[i, 'latitude_augmented'] = latitude0
-            self.df.loc[i, 'x_augmented'] = self._lon2x(longitude0)
-            self.df.loc[i, 'y_augmented'] = self._lat2y(latitude0)
+    def _coordinate_augmentation(self):
+        longitude_augmented, latitude_augmented = _augment_coordinates(self.df["longitude"].to_numpy(), self.df["latitude"].to_numpy(), 
+                                                                       self.df["gps_speed"].to_numpy(), self.df["seconds"].to_numpy(), 
+                                                                       self.df["gps_heading"].to_numpy(), self.df["survey_type"].isin([0, 1]).to_numpy())
+        
+        self.df["longitude_augmented"] = longitude_augmented
+        self.df["latitude_augmented"] = latitude_augmented
+        self.df["x_augmented"] = self._lon2x(longitude_augmented)
+        self.df["y_augmented"] = self._lat2y(latitude_augmented)
+        
+        #Coordinates of the first frame are not augmented
+        self.df.loc[self.df.index[:1], ["x_augmented", "y_augmented"]] = np.nan
 
     def get_latitude_distance(self, lat1: float, lat2: float) -> float:
         return math.radians(abs(lat2 - lat1)) * 6356752.3142
@@ -266,18 +575,56 @@ class Sonar:
         return math.radians(abs(lon2 - lon1)) * (6356752.3142 * math.cos(math.radians(lat)))
         
     def _valid_channels(self):
-        found_channels = set(self.df["survey"].tolist())
-        self.valid_channels = [i for i in self.supported_channels if i in found_channels]
+        self.valid_channels = [i for i in self.supported_channels if len(self._channel_rows(i)) > 0]
 
     def _select(self):
         self.df = self.df[self.vars_to_keep]
         
     def _describe(self):
         for i in self.valid_channels:
-            data = self.df.query(f"survey == '{i}'")
-            nrow = data.shape[0]
+            nrow = len(self._channel_rows(i))
             self.valid_channels_records.append(nrow)
                 
+    def _store_echoes(self):
+        self.echoes = {}
+        for i in self.valid_channels:
+            index = self._channel_index(i)
+            self.echoes[i] = EchoStore.from_buffer(self.buffer, self._echo_starts.loc[index].to_numpy(), self._echo_lengths.loc[index].to_numpy(), index)
+
+    def _channel_rows(self, channel: str) -> np.ndarray:
+        #Positions of the rows of a channel in the dataframe. 
+        #Rows are grouped by channel once and grouped again only if "df" or its index has been replaced.
+        #The grouping is replaced in a single assignment, so threads never see a partly updated grouping
+        df = self.df
+        rows_df, rows_index, rows = self._rows_cache
+        if rows_df is not df or rows_index is not df.index:
+            codes, names = pd.factorize(df["survey"])
+            order = np.argsort(codes, kind="stable")
+            edges = np.searchsorted(codes[order], np.arange(len(names) + 1))
+            rows = {name: order[edges[i]:edges[i+1]] for i, name in enumerate(names)}
+            self._rows_cache = (df, df.index, rows)
+
+        return(rows.get(channel, np.empty(0, dtype="int64")))
+
+    def _channel_index(self, channel: str) -> np.ndarray:
+        #Row labels of a channel
+        return(self.df.index.to_numpy()[self._channel_rows(channel)])
+
+    def _channel_values(self, channel: str, column: str) -> np.ndarray:
+        #Values of a column for the rows of a channel, without copying the other columns
+        return(self.df[column].to_numpy()[self._channel_rows(channel)])
+
+    def _channel_echoes(self, channel: str) -> EchoStore:
+        #Pings matching the rows of a channel, which only differ from the stored pings if "df" has been modified
+        if channel not in self.echoes:
+            raise ValueError("Pixels have not been loaded, use load_echoes=True")
+        
+        echoes = self.echoes[channel]
+        index = self._channel_index(channel)
+        if len(echoes.index) == len(index) and (echoes.index == index).all():
+            return(echoes)
+        return(echoes.take(echoes.positions(index)))
+                
     def _drop_zero_depth(self):
         self.df = self.df[self.df["water_depth"] > 0]
         
@@ -290,95 +637,503 @@ class Sonar:
         for i, c in zip(self.valid_channels, self.valid_channels_records):
             base_string += f"- {i.title()} channel with {c} frames\n"
 
-        datetime_start = self.df["datetime"].iloc[0]
-        datetime_end = self.df["datetime"].iloc[-1]
-        base_string += f"\nStart time: {datetime_start}\nEnd time: {datetime_end}\n"
+        if "datetime" in self.df.columns and self.df.shape[0] > 0:
+            datetime_start = self.df["datetime"].iloc[0]
+            datetime_end = self.df["datetime"].iloc[-1]
+            base_string += f"\nStart time: {datetime_start}\nEnd time: {datetime_end}\n"
         base_string += f"\nFile info: version {self.version}, device {self.device_id}, blocksize {self.blocksize}, frame version {self.frame_version}"
         
         return(base_string)
         
     def image(self, channel: str) -> np.ndarray:
-        '''Extract the raw sonar image for a specific channel'''
+        '''Extract the raw sonar image for a specific channel.
+        The image is a read-only view of the stored pixels, use .copy() to get a modifiable array'''
         
         if channel not in self.valid_channels:
             raise ValueError("Wrong channel name or no data for that channel")
         
-        return(np.stack(self.df.query(f"survey == '{channel}'")["frames"]))            
+        return(self._channel_echoes(channel).matrix)
     
     def sidescan_xyz(self) -> pd.DataFrame:
         '''Extract georeferenced sidescan data as XYZ coordinates'''
 
         if "sidescan" not in self.valid_channels:
             raise ValueError("No sidescan data found")
-        
-        data = self.df.query(f"survey == 'sidescan'")
-        dist = [np.linspace(start, stop, num = len(f)) for start, stop, f in zip(data["min_range"], 
-                                                                                 data["max_range"], 
-                                                                                 data["frames"])]
-        dist_stack = np.stack(dist)
-        
-        sidescan_z = self.image("sidescan")            
 
-        if self.augment_coords:
-            sidescan_x = np.expand_dims(data["x_augmented"], axis=1) + dist_stack * np.cos(np.expand_dims(data["gps_heading"], axis=1))
-            sidescan_y = np.expand_dims(data["y_augmented"], axis=1) - dist_stack * np.sin(np.expand_dims(data["gps_heading"], axis=1))
-
-        else:
-            sidescan_x = np.expand_dims(data["x"], axis=1) + dist_stack * np.cos(np.expand_dims(data["gps_heading"], axis=1))
-            sidescan_y = np.expand_dims(data["y"], axis=1) - dist_stack * np.sin(np.expand_dims(data["gps_heading"], axis=1))
+        #Output columns are allocated once and filled chunk by chunk
+        n_pixels = int(self._channel_echoes("sidescan").offsets[-1])
+        sidescan_x = np.empty(n_pixels)
+        sidescan_y = np.empty(n_pixels)
+        sidescan_z = np.empty(n_pixels, dtype="uint8")
         
-        sidescan_df = pd.DataFrame({"x": sidescan_x.ravel(),
-                                    "y": sidescan_y.ravel(),
-                                    "z": sidescan_z.ravel()})
+        position = 0
+        for x, y, z in self._sidescan_pings(chunk_pings=1000):
+            sidescan_x[position:(position + x.size)] = x.ravel()
+            sidescan_y[position:(position + y.size)] = y.ravel()
+            sidescan_z[position:(position + z.size)] = z.ravel()
+            position += z.size
+        
+        sidescan_df = pd.DataFrame({"x": sidescan_x,
+                                    "y": sidescan_y,
+                                    "z": sidescan_z})
 
         sidescan_df["longitude"] = self._x2lon(sidescan_df["x"])
         sidescan_df["latitude"] = self._y2lat(sidescan_df["y"])
         
         return(sidescan_df)
+
+    def iter_sidescan_xyz(self, chunk_pings: int = 1000, dtype: np.dtype = np.float32, lonlat: bool = False):
+        '''Extract georeferenced sidescan data as XYZ coordinates in chunks of pings.
+        
+        Yields a dataframe with columns "x", "y" and "z" for chunks of at most "chunk_pings" pings, 
+        so the data can be written or reduced without holding all points in memory. 
+        Only the pixels of one chunk are held at a time, also when the file is memory-mapped (mmap=True). 
+        Coordinates are returned as "dtype" (float32 is default) and "longitude"/"latitude" are only added when "lonlat" is True.
+        Note that float32 coordinates are rounded to within about 0.5 meter for x/y and 1e-5 degree for longitude/latitude, use np.float64 for full precision'''
+
+        for x, y, z in self._sidescan_pings(chunk_pings):
+            x = x.ravel()
+            y = y.ravel()
+            chunk = pd.DataFrame({"x": x.astype(dtype),
+                                  "y": y.astype(dtype),
+                                  "z": z.ravel()})
+
+            if lonlat:
+                chunk["longitude"] = self._x2lon(x).astype(dtype)
+                chunk["latitude"] = self._y2lat(y).astype(dtype)
+
+            yield(chunk)
     
-    def _interp_water(self, water, depth, out_len):
-        x = np.linspace(0, depth, num=out_len)
-        xp = np.linspace(0, depth, num=len(water))
-        y = np.interp(x, xp, water)
+    def _sidescan_pings(self, chunk_pings: int):
+        #Yield x, y and z arrays with one row per sidescan ping for chunks of at most "chunk_pings" pings of equal length.
+        #Distances along each ping are computed as in np.linspace from one shared range vector per ping length
+        if "sidescan" not in self.valid_channels:
+            raise ValueError("No sidescan data found")
+
+        echoes = self._channel_echoes("sidescan")
+        lengths = echoes.lengths
+        x_column, y_column = ("x_augmented", "y_augmented") if self.augment_coords else ("x", "y")
+        ping_x = self._channel_values("sidescan", x_column).astype("float64")
+        ping_y = self._channel_values("sidescan", y_column).astype("float64")
+        heading = self._channel_values("sidescan", "gps_heading")
+        cos_heading = np.cos(heading)
+        sin_heading = np.sin(heading)
+        start = self._channel_values("sidescan", "min_range").astype("float64")
+        stop = self._channel_values("sidescan", "max_range").astype("float64")
+
+        run_edges = np.concatenate([[0], np.flatnonzero(np.diff(lengths)) + 1, [len(lengths)]])
+        ranges = {}
+
+        for run_start, run_end in zip(run_edges[:-1], run_edges[1:]):
+            n = int(lengths[run_start])
+            if n == 0:
+                continue
+            if n not in ranges:
+                ranges[n] = np.arange(n, dtype="float64")
+
+            for first in range(run_start, run_end, chunk_pings):
+                last = min(first + chunk_pings, run_end)
+                step = (stop[first:last] - start[first:last]) / max(n - 1, 1)
+                dist = ranges[n] * step[:, None] + start[first:last, None]
+                if n > 1:
+                    dist[:, -1] = stop[first:last]
+
+                x = ping_x[first:last, None] + dist * cos_heading[first:last, None]
+                y = ping_y[first:last, None] - dist * sin_heading[first:last, None]
+                z = echoes.pings(first, last).reshape(last - first, n)
+
+                yield(x, y, z)
+
+    def sidescan_mosaic(self, resolution: float = 1.0, agg: str = "mean", chunk_pings: int = 1000) -> tuple:
+        '''Rasterize georeferenced sidescan data to a grid.
+
+        The sidescan pixels are binned directly into a 2-D array of cells of size "resolution" (meters) and aggregated by "agg", 
+        which is "mean" or "max" of the pixel values or "count" of the pixels in each cell. Cells without pixels are NaN (0 for "count").
+        Pings are processed in chunks of "chunk_pings" without creating the full XYZ data or copying all pixels of the channel.
         
-        return(y)
+        Returns the grid with the first row to the north and the geotransform (x_min, resolution, 0, y_max, 0, -resolution) 
+        of the upper left corner in the same x/y coordinates as the dataframe'''
+
+        if agg not in ["mean", "max", "count"]:
+            raise ValueError('"agg" must be one of "mean", "max" or "count"')
+
+        if not resolution > 0:
+            raise ValueError('"resolution" must be greater than 0')
+
+        #Grid extent from the pixels at the ends of each ping, leaving out pings without coordinates
+        #(e.g. the first frame with augmented coordinates)
+        x_min, y_min, x_max, y_max = np.inf, np.inf, -np.inf, -np.inf
+        for x, y, z in self._sidescan_pings(chunk_pings):
+            x_ends, y_ends = x[:, [0, -1]], y[:, [0, -1]]
+            finite = np.isfinite(x_ends) & np.isfinite(y_ends)
+            if finite.any():
+                x_min, x_max = min(x_min, x_ends[finite].min()), max(x_max, x_ends[finite].max())
+                y_min, y_max = min(y_min, y_ends[finite].min()), max(y_max, y_ends[finite].max())
+
+        if not np.isfinite(x_min):
+            raise ValueError("No sidescan pixels with coordinates found")
+
+        ncols = int((x_max - x_min) // resolution) + 1
+        nrows = int((y_max - y_min) // resolution) + 1
+        counts = np.zeros(nrows * ncols, dtype="int64")
+        values = np.zeros(nrows * ncols) if agg == "mean" else np.full(nrows * ncols, -np.inf)
+
+        for x, y, z in self._sidescan_pings(chunk_pings):
+            #Pixels without finite coordinates or values are left out before casting to cells
+            finite = np.isfinite(x) & np.isfinite(y) & np.isfinite(z)
+            if not finite.any():
+                continue
+            x, y, z = x[finite], y[finite], z[finite]
+
+            cols = ((x - x_min) // resolution).astype("int64")
+            rows = ((y_max - y) // resolution).astype("int64")
+            cells = rows * ncols + cols
+
+            #Accumulate over the range of cells covered by the chunk only
+            first_cell = cells.min()
+            cells -= first_cell
+            n_cells = cells.max() + 1
+            counts[first_cell:(first_cell + n_cells)] += np.bincount(cells, minlength=n_cells)
+            if agg == "mean":
+                values[first_cell:(first_cell + n_cells)] += np.bincount(cells, weights=z.ravel(), minlength=n_cells)
+            elif agg == "max":
+                np.maximum.at(values[first_cell:(first_cell + n_cells)], cells, z.ravel())
+
+        if agg == "count":
+            grid = counts
+        else:
+            with np.errstate(invalid="ignore", divide="ignore"):
+                grid = values / counts if agg == "mean" else values
+            grid[counts == 0] = np.nan
+
+        geotransform = (x_min, resolution, 0.0, y_max, 0.0, -resolution)
+
+        return(grid.reshape(nrows, ncols), geotransform)
+    
+    def image_pyramid(self, channel: str, levels: int = 4, agg: str = "mean", factor: int = 2, path: str = None) -> list:
+        '''Reduced versions of the sonar image of a specific channel for fast display, e.g. of a whole survey.
+
+        Returns a list of "levels" images, where level k (item k-1) is pooled over blocks of factor**k pings along the track
+        and factor**k pixels across the track by "agg" ("mean" or "max"). The full resolution image is image(channel).
+        Blocks at the end of the image and pixels beyond the end of shorter pings are left out of the pooling, and blocks without pixels are NaN.
+        All levels are computed in one pass over chunks of pings, holding the pixels of one chunk at a time.
+
+        Arguments:
+        path = "path/to/pyramid" - (None is default) - Save the reduced levels in this directory as 'level_1.npy', 'level_2.npy', ...
+        The returned levels are then memory-mapped from the files, which can be loaded again with np.load(..., mmap_mode="r").
+        '''
+
+        if channel not in self.valid_channels:
+            raise ValueError("Wrong channel name or no data for that channel")
+
+        if agg not in ["mean", "max"]:
+            raise ValueError('"agg" must be one of "mean" or "max"')
+
+        if levels < 1 or factor < 2:
+            raise ValueError('"levels" must be at least 1 and "factor" at least 2')
+
+        echoes = self._channel_echoes(channel)
+        lengths = echoes.lengths
+        n_pings, max_len = len(lengths), int(lengths.max())
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+        pyramid = []
+        for k in range(1, levels + 1):
+            shape = (-(-n_pings // factor**k), -(-max_len // factor**k))
+            if path is None:
+                pyramid.append(np.empty(shape, dtype="float32"))
+            else:
+                pyramid.append(np.lib.format.open_memmap(os.path.join(path, f"level_{k}.npy"), mode="w+", dtype="float32", shape=shape))
+
+        #Chunks hold whole blocks of the coarsest level, so blocks never span two chunks
+        block = factor**levels
+        chunk_pings = block * max(1, 2**22 // (block * max(max_len, 1)))
+        pixel = np.arange(max_len)
+
+        for first in range(0, n_pings, chunk_pings):
+            last = min(first + chunk_pings, n_pings)
+            chunk_lengths = lengths[first:last]
+            inside = pixel < chunk_lengths[:, None]
+            pixels = echoes.pings(first, last)
+
+            #Mean pooling carries sums and pixel counts between levels, so each level is the mean of the original pixels
+            if agg == "mean":
+                values = np.zeros((last - first, max_len))
+                values[inside] = pixels
+                counts = inside.astype("float64")
+            else:
+                values = np.full((last - first, max_len), np.nan, dtype="float32")
+                values[inside] = pixels
+
+            for k, level in enumerate(pyramid, start=1):
+                rows, cols = -(-values.shape[0] // factor), -(-values.shape[1] // factor)
+                pad = ((0, rows * factor - values.shape[0]), (0, cols * factor - values.shape[1]))
+                if pad[0][1] > 0 or pad[1][1] > 0:
+                    values = np.pad(values, pad, constant_values=0 if agg == "mean" else np.nan)
+                    counts = np.pad(counts, pad) if agg == "mean" else None
 
-    def water(self, channel: str, pixels: int) -> np.ndarray:
+                if agg == "mean":
+                    values = _pool_blocks(values, factor, np.add)
+                    counts = _pool_blocks(counts, factor, np.add)
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        level_values = values / counts
+                else:
+                    values = _pool_blocks(values, factor, np.fmax)
+                    level_values = values
+
+                level_first = first // factor**k
+                level[level_first:(level_first + rows)] = level_values
+
+        if path is not None:
+            for level in pyramid:
+                level.flush()
+
+        return(pyramid)
+
+    def _channel_bottom_index(self, channel: str, bottom_index: np.ndarray = None) -> np.ndarray:
+        #Bottom index of each ping of a channel, from the dataframe unless given, e.g. by detect_bottom()
+        if bottom_index is None:
+            return(self._channel_values(channel, "bottom_index"))
+
+        bottom_index = np.asarray(bottom_index)
+        if len(bottom_index) != len(self._channel_rows(channel)):
+            raise ValueError("Length of bottom_index does not match the number of pings of the channel")
+        return(bottom_index)
+
+    def water(self, channel: str, pixels: int, bottom_index: np.ndarray = None) -> np.ndarray:
         '''Extract the water column part of the the raw sonar imagery for a specific channel.
         The water column part extends from the surface to water depth.
-        Linear interpolation is performed for each sonar ping to create arrays of equal length of size "pixels"'''
+        Linear interpolation is performed for each sonar ping to create arrays of equal length of size "pixels".
+        The bottom index of each ping is taken from the dataframe unless given in "bottom_index", e.g. from detect_bottom()'''
 
         if channel not in self.valid_channels or channel == "sidescan":
             raise ValueError(f'Valid channels: {", ".join(self.valid_channels)}')
         
-        data = self.df.query(f"survey == '{channel}'")
-        frames_water = [f[0:b] for f, b in zip(data["frames"], data["bottom_index"])]
-        frames_water_interp = [self._interp_water(f, d, pixels) for f, d in zip(frames_water, data["water_depth"])]
+        echoes = self._channel_echoes(channel)
+        water_len = np.clip(self._channel_bottom_index(channel, bottom_index).astype("int64"), 0, echoes.lengths)
+
+        if (water_len == 0).any():
+            raise ValueError("Pings without water column pixels, e.g. where water depth is 0")
+
+        values = echoes.values
+        starts = echoes.offsets[:-1]
+        water = np.empty((len(water_len), pixels))
+
+        #Fractional pixel positions along the water column of each ping, interpolating between evenly spaced samples as np.interp
+        steps = np.arange(pixels) / max(pixels - 1, 1)
+        chunk_pings = max(1, 2**22 // max(pixels, 1))
+
+        for first in range(0, len(water_len), chunk_pings):
+            last = min(first + chunk_pings, len(water_len))
+            n = water_len[first:last, None]
+            u = steps * (n - 1)
+            lower = np.minimum(u.astype("int64"), np.maximum(n - 2, 0))
+            upper = np.minimum(lower + 1, n - 1)
+            weight = u - lower
+            base = starts[first:last, None]
+            water[first:last] = values[base + lower] * (1 - weight) + values[base + upper] * weight
         
-        return(np.stack(frames_water_interp))
+        return(water)
     
-    def bottom(self, channel: str) -> np.ndarray:
+    def bottom(self, channel: str, mode: str = "crop", fill_value = np.nan, bottom_index: np.ndarray = None) -> np.ndarray:
         '''Extract the bottom (sediment) part of the the raw sonar imagery for a specific channel.
         The bottom part extends from the water depth to the maximum range of the sonar.
-        The length of the arrays are determined by the minimum length of all bottom pings for the survey'''
+        With mode "crop" (default) the length of the arrays are determined by the minimum length of all bottom pings for the survey.
+        With mode "pad" the length is the maximum length of all bottom pings and shorter pings are padded with "fill_value" (NaN is default).
+        The bottom index of each ping is taken from the dataframe unless given in "bottom_index", e.g. from detect_bottom()'''
         
         if channel not in self.valid_channels or channel == "sidescan":
             raise ValueError(f'Valid channels: {", ".join(self.valid_channels)}')
+
+        if mode not in ["crop", "pad"]:
+            raise ValueError('Valid modes: crop, pad')
         
-        data = self.df.query(f"survey == '{channel}'")
-        frames_bottom = [f[b:] for f, b in zip(data["frames"], data["bottom_index"])]
-        min_len = min([len(f) for f in frames_bottom])
-        frames_bottom_cut = [f[:min_len] for f in frames_bottom]
-        
-        return(np.stack(frames_bottom_cut))
+        echoes = self._channel_echoes(channel)
+        ping_len = echoes.lengths
+        bottom_start = np.clip(self._channel_bottom_index(channel, bottom_index).astype("int64"), 0, ping_len)
+        bottom_len = ping_len - bottom_start
+        starts = echoes.offsets[:-1] + bottom_start
+
+        if mode == "crop":
+            min_len = int(bottom_len.min())
+            return(_gather_pings(echoes.values, starts, np.full(len(starts), min_len)).reshape(len(starts), min_len))
+
+        max_len = int(bottom_len.max()) if len(bottom_len) > 0 else 0
+        #Integer fill values are given the smallest type holding them, e.g. int16 for -1, as Python integers otherwise keep the 'uint8' type of the pixels
+        fill_type = np.min_scalar_type(fill_value) if isinstance(fill_value, (int, np.integer)) else fill_value
+        bottom = np.full((len(starts), max_len), fill_value, dtype=np.result_type(np.uint8, fill_type))
+        bottom[np.arange(max_len) < bottom_len[:, None]] = _gather_pings(echoes.values, starts, bottom_len)
 
-    def bottom_intensity(self, channel: str) -> np.ndarray:
-        '''Extract raw sonar intensity at the bottom'''
+        return(bottom)
+
+    def bottom_intensity(self, channel: str, bottom_index: np.ndarray = None) -> np.ndarray:
+        '''Extract raw sonar intensity at the bottom.
+        The bottom index of each ping is taken from the dataframe unless given in "bottom_index", e.g. from detect_bottom()'''
         
         if channel not in self.valid_channels or channel == "sidescan":
             raise ValueError(f'Valid channels: {", ".join(self.valid_channels)}')
         
-        data = self.df.query(f"survey == '{channel}'")
-        bottom_intensity = np.array([f[i] for f, i in zip(data["frames"], data["bottom_index"])])
+        echoes = self._channel_echoes(channel)
+        bottom_index = self._channel_bottom_index(channel, bottom_index)
+
+        if ((bottom_index < 0) | (bottom_index >= echoes.lengths)).any():
+            raise IndexError("Bottom index outside of ping")
+
+        bottom_intensity = echoes.values[echoes.offsets[:-1] + bottom_index]
                 
         return(bottom_intensity)
+
+    def detect_bottom(self, channel: str, method: str = "threshold", threshold: float = 0.5, window: int = 5,
+                      min_depth: float = 0.5, smooth: int = 5) -> np.ndarray:
+        '''Detect the bottom in the pings of a specific channel from the sonar imagery instead of the recorded water depth.
+        Returns the bottom index of each ping of the channel, which can be passed to water(), bottom() and bottom_intensity().
+
+        Arguments:
+        method = "threshold" - (threshold is default) - The bottom is the first pixel with an intensity of at least "threshold" times the maximum intensity of the ping.
+        method = "gradient" - The bottom is the pixel with the largest increase from the mean intensity of the "window" pixels above to the mean intensity of the "window" pixels below.
+        min_depth - Pixels shallower than this depth in meters are ignored, e.g. to skip noise near the transducer.
+        smooth - Number of consecutive pings of the running median used to smooth the bottom along the track, 1 for no smoothing.
+        '''
+
+        if channel not in self.valid_channels or channel == "sidescan":
+            raise ValueError(f'Valid channels: {", ".join(self.valid_channels)}')
+
+        if method not in ["threshold", "gradient"]:
+            raise ValueError('Valid methods: threshold, gradient')
+
+        echoes = self._channel_echoes(channel)
+        lengths = echoes.lengths
+        ping_range = self._channel_values(channel, "max_range") - self._channel_values(channel, "min_range")
+        first_pixel = np.clip((lengths / ping_range * min_depth).astype("int64"), 0, np.maximum(lengths - 1, 0))
+        bottom_index = np.zeros(len(lengths), dtype="int64")
+
+        #Pings are processed in chunks as matrices padded to the length of the longest ping
+        max_len = int(lengths.max()) if len(lengths) > 0 else 0
+        pixel = np.arange(max_len)
+        chunk_pings = max(1, 2**22 // max(max_len, 1))
+
+        for first in range(0, len(lengths), chunk_pings):
+            last = min(first + chunk_pings, len(lengths))
+            chunk_lengths = lengths[first:last]
+            inside = (pixel >= first_pixel[first:last, None]) & (pixel < chunk_lengths[:, None])
+            pings = np.zeros((last - first, max_len), dtype="float32")
+            pings[pixel < chunk_lengths[:, None]] = echoes.pings(first, last)
+
+            if method == "threshold":
+                ping_max = np.where(inside, pings, 0).max(axis=1)
+                above = inside & (pings >= threshold * ping_max[:, None])
+                bottom_index[first:last] = above.argmax(axis=1)
+            else:
+                #Sums of the pixels above and below each pixel from cumulative sums padded by "window" at both ends
+                cumulative = np.zeros((last - first, max_len + 2*window + 1), dtype="float32")
+                np.cumsum(pings, axis=1, out=cumulative[:, (window + 1):(max_len + window + 1)])
+                cumulative[:, (max_len + window + 1):] = cumulative[:, [max_len + window]]
+                below = cumulative[:, (2*window):(max_len + 2*window)] - cumulative[:, window:(max_len + window)]
+                above = cumulative[:, window:(max_len + window)] - cumulative[:, :max_len]
+                step = np.where(inside & (pixel >= window) & (pixel + window <= chunk_lengths[:, None]), below - above, -np.inf)
+                bottom_index[first:last] = np.where(np.isfinite(step).any(axis=1), step.argmax(axis=1), first_pixel[first:last])
+
+        if smooth > 1 and len(bottom_index) > 0:
+            padded = np.pad(bottom_index, (smooth // 2, (smooth - 1) // 2), mode="edge")
+            bottom_index = np.median(np.lib.stride_tricks.sliding_window_view(padded, smooth), axis=1).round().astype("int64")
+
+        return(np.clip(bottom_index, 0, np.maximum(lengths - 1, 0)).astype("int32"))
+
+    def bottom_window_stats(self, channel: str, above: int = 5, below: int = 20, bottom_index: np.ndarray = None) -> pd.DataFrame:
+        '''Intensity statistics of the pixels around the bottom of each ping of a specific channel.
+        The window spans from "above" pixels above to "below" pixels below the bottom index (both included) and is cut at the ends of the ping.
+        Returns a dataframe with the mean, standard deviation, minimum, maximum and number of pixels of the window for each ping.
+        The bottom index of each ping is taken from the dataframe unless given in "bottom_index", e.g. from detect_bottom()'''
+
+        if channel not in self.valid_channels or channel == "sidescan":
+            raise ValueError(f'Valid channels: {", ".join(self.valid_channels)}')
+
+        echoes = self._channel_echoes(channel)
+        lengths = echoes.lengths
+        bottom_index = self._channel_bottom_index(channel, bottom_index).astype("int64")
+
+        pixel = bottom_index[:, None] + np.arange(-above, below + 1)
+        inside = (pixel >= 0) & (pixel < lengths[:, None])
+        window = echoes.values[echoes.offsets[:-1, None] + np.clip(pixel, 0, np.maximum(lengths - 1, 0)[:, None])] if len(echoes.values) > 0 else np.zeros(pixel.shape)
+        window = np.where(inside, window, np.nan)
+
+        n = inside.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nansum(window, axis=1) / n
+            std = np.sqrt(np.nansum((window - mean[:, None])**2, axis=1) / n)
+
+        window_stats = pd.DataFrame({"mean": mean, "std": std, 
+                                     "min": np.where(n > 0, np.nanmin(np.where(inside, window, np.inf), axis=1), np.nan),
+                                     "max": np.where(n > 0, np.nanmax(np.where(inside, window, -np.inf), axis=1), np.nan),
+                                     "n": n}, index=self._channel_index(channel))
+
+        return(window_stats)
+
+    def _extract(self, method: str, *args):
+        #Result of an extraction method, from the result cache if computed before from the same dataframe
+        df = self.df
+        key = (method,) + args
+        try:
+            hash(key)
+        except TypeError:
+            #Results of unhashable arguments, e.g. "bottom_index" arrays, are not cached
+            return(getattr(self, method)(*args))
+
+        result = self.result_cache.get(key, df)
+        if result is None:
+            result = getattr(self, method)(*args)
+            self.result_cache.put(key, result, df, self._stored_arrays())
+
+        #Cached dataframes are shared, so each caller gets its own copy of the columns
+        if isinstance(result, pd.DataFrame):
+            return(result.copy())
+        return(result)
+
+    def _stored_arrays(self) -> list:
+        #Arrays of the stored pixels and the file buffer, which results viewing them do not own
+        stored = [echoes._values for echoes in self.echoes.values() if echoes._values is not None]
+        if isinstance(self.buffer, np.ndarray):
+            stored.append(self.buffer)
+        return(stored)
+
+    async def _extract_async(self, method: str, *args):
+        loop = asyncio.get_running_loop()
+        return(await loop.run_in_executor(self.executor, functools.partial(self._extract, method, *args)))
+
+    async def aimage(self, channel: str) -> np.ndarray:
+        '''Asynchronous image(), run in a thread pool with results kept in "result_cache"'''
+        return(await self._extract_async("image", channel))
+
+    async def awater(self, channel: str, pixels: int, bottom_index: np.ndarray = None) -> np.ndarray:
+        '''Asynchronous water(), run in a thread pool with results kept in "result_cache"'''
+        return(await self._extract_async("water", channel, pixels, bottom_index))
+
+    async def abottom(self, channel: str, mode: str = "crop", fill_value = np.nan, bottom_index: np.ndarray = None) -> np.ndarray:
+        '''Asynchronous bottom(), run in a thread pool with results kept in "result_cache"'''
+        return(await self._extract_async("bottom", channel, mode, fill_value, bottom_index))
+
+    async def abottom_intensity(self, channel: str, bottom_index: np.ndarray = None) -> np.ndarray:
+        '''Asynchronous bottom_intensity(), run in a thread pool with results kept in "result_cache"'''
+        return(await self._extract_async("bottom_intensity", channel, bottom_index))
+
+    async def asidescan_xyz(self) -> pd.DataFrame:
+        '''Asynchronous sidescan_xyz(), run in a thread pool with results kept in "result_cache"'''
+        return(await self._extract_async("sidescan_xyz"))
+
+    def to_npz(self, path: str, compressed: bool = False):
+        '''Write the dataframe and pixels to a '.npz' file, which can be loaded again with Sonar.from_export()'''
+
+        export.to_npz(self, path, compressed)
+
+    def to_arrow(self):
+        '''Convert the dataframe to an Arrow table with the pixels of each row in an "echoes" binary column (requires pyarrow)'''
+
+        return(export.to_arrow(self))
+
+    def to_parquet(self, path: str, **kwargs):
+        '''Write the table from to_arrow() to a Parquet file, which can be loaded again with Sonar.from_export() (requires pyarrow).
+        Keyword arguments are passed to pyarrow.parquet.write_table, e.g. row_group_size or compression'''
+
+        export.to_parquet(self, path, **kwargs)
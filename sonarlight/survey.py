@@ -0,0 +1,152 @@
+#Definition of Survey class
+
+import numpy as np
+import pandas as pd
+from .sonar_class import Sonar
+from .echo_store import EchoStore
+from .frame_index import FrameIndex, index_dtype, _select_frames
+
+#dtype of the frames of a survey, the frame index entry with the position of the file in the survey and of the frame in the file
+survey_dtype = np.dtype([("file", "<u2"), ("frame", "<i8")] + [(name, index_dtype.fields[name][0]) for name in index_dtype.names])
+
+def _merge_echoes(stores: list) -> EchoStore:
+    #One store of the pings of several stores, ordered by row label
+    lengths = np.concatenate([i.lengths for i in stores])
+    index = np.concatenate([i.index for i in stores])
+    values = np.concatenate([i.values for i in stores])
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype("int64")
+    values.flags.writeable = False
+
+    echoes = EchoStore(values, offsets, index)
+    if (np.diff(index) < 0).any():
+        echoes = echoes.take(np.argsort(index, kind="stable"))
+
+    return(echoes)
+
+class Survey:
+    '''
+    Many '.sl2' or '.sl3' files of one trip, e.g. consecutive logs, read as one time-ordered survey.
+
+    The frame indices of the files (see Sonar.open_index()) are combined into one index ordered by time when first needed.
+    Frames recorded in more than one file, i.e. with the same time and survey type, are only kept from the first file in "paths".
+    Extraction methods only decode the frames matching the given time window, area and channel, and the dataframe row
+    labels are positions in the survey index, so rows from different files never share labels.
+
+    Arguments:
+    paths - List of '.sl2' or '.sl3' files.
+    sidecar = True - (True is default) - Load and save the frame index of each file in a sidecar file next to the file.
+    '''
+
+    def __init__(self, paths: list, sidecar: bool = True):
+        if len(paths) == 0:
+            raise ValueError("No files given")
+
+        self.paths = list(paths)
+        self.sidecar = sidecar
+        self._indices = None
+        self._frames = None
+
+    @property
+    def indices(self) -> list:
+        '''Frame index of each file'''
+
+        if self._indices is None:
+            self._indices = [FrameIndex.open(path, self.sidecar) for path in self.paths]
+        return(self._indices)
+
+    @property
+    def frames(self) -> np.ndarray:
+        '''Time-ordered frames of all files as a structured array of frame index entries with the positions of the file ("file") and of the frame in the file ("frame")'''
+
+        if self._frames is None:
+            parts = []
+            for i, index in enumerate(self.indices):
+                part = np.empty(len(index), dtype=survey_dtype)
+                part["file"] = i
+                part["frame"] = np.arange(len(index))
+                for name in index_dtype.names:
+                    part[name] = index.frames[name]
+                parts.append(part)
+            frames = np.concatenate(parts)
+
+            #Sorting is stable, so frames with the same time and survey type keep the order of the files
+            frames = frames[np.lexsort((frames["survey_type"], frames["time"]))]
+
+            #Duplicated frames are dropped unless they are from the same file as the first frame
+            new_key = np.ones(len(frames), dtype=bool)
+            new_key[1:] = (frames["time"][1:] != frames["time"][:-1]) | (frames["survey_type"][1:] != frames["survey_type"][:-1])
+            first_file = frames["file"][new_key][np.cumsum(new_key) - 1]
+            self._frames = frames[frames["file"] == first_file]
+
+        return(self._frames)
+
+    def select(self, time_range: tuple = None, bbox: tuple = None, channel = None) -> np.ndarray:
+        '''Positions in the survey index of the frames matching all of the given conditions, see FrameIndex.select()'''
+
+        return(_select_frames(self.frames, time_range, bbox, channel))
+
+    def read(self, time_range: tuple = None, bbox: tuple = None, channel = None,
+             clean: bool = True, columns: list = None, load_echoes: bool = True) -> Sonar:
+        '''
+        Decode the frames matching the conditions of select() from all files into one Sonar object.
+
+        The pixels of each file are only read for the matching frames. Raw frame headers ("headers") are not available
+        if frames from more than one file are read, and file info in the summary is from the first file read.
+
+        Arguments:
+        time_range, bbox, channel - Conditions passed to select().
+        clean, columns, load_echoes - Passed to Sonar.
+        '''
+
+        positions = self.select(time_range, bbox, channel)
+        files = self.frames["file"][positions]
+        parts = []
+
+        for i in np.unique(files):
+            labels = positions[files == i]
+            parts.append(self.indices[i]._read(self.frames["frame"][labels], labels, channel, clean, columns, load_echoes))
+
+        if len(parts) == 0:
+            return(self.indices[0]._read(positions, positions, channel, clean, columns, load_echoes))
+
+        if len(parts) == 1:
+            return(parts[0])
+
+        sonar = parts[0]
+        sonar.df = pd.concat([i.df for i in parts]).sort_index(kind="stable")
+        sonar.buffer = None
+        sonar.valid_channels_records = []
+        sonar._valid_channels()
+        sonar._describe()
+
+        if load_echoes:
+            sonar.echoes = {channel: _merge_echoes([i.echoes[channel] for i in parts if channel in i.echoes])
+                            for channel in sonar.valid_channels}
+
+        return(sonar)
+
+    def image(self, channel: str, time_range: tuple = None, bbox: tuple = None) -> np.ndarray:
+        '''Extract the raw sonar image for a specific channel across files, see Sonar.image()'''
+
+        return(self.read(time_range, bbox, channel).image(channel))
+
+    def water(self, channel: str, pixels: int, time_range: tuple = None, bbox: tuple = None) -> np.ndarray:
+        '''Extract the water column part of the raw sonar imagery for a specific channel across files, see Sonar.water()'''
+
+        return(self.read(time_range, bbox, channel).water(channel, pixels))
+
+    def bottom(self, channel: str, mode: str = "crop", fill_value = np.nan, time_range: tuple = None, bbox: tuple = None) -> np.ndarray:
+        '''Extract the bottom part of the raw sonar imagery for a specific channel across files, see Sonar.bottom()'''
+
+        return(self.read(time_range, bbox, channel).bottom(channel, mode, fill_value))
+
+    def sidescan_xyz(self, time_range: tuple = None, bbox: tuple = None) -> pd.DataFrame:
+        '''Extract georeferenced sidescan data as XYZ coordinates across files, see Sonar.sidescan_xyz()'''
+
+        return(self.read(time_range, bbox, "sidescan").sidescan_xyz())
+
+    def __len__(self) -> int:
+        return(len(self.frames))
+
+    def __repr__(self) -> str:
+        return(f"Survey of {len(self.paths)} files")
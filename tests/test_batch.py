@@ -0,0 +1,29 @@
+import unittest
+from sonarlight import Sonar, load_many
+import numpy as np
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.paths = ["example_files/example_sl2_file.sl2", 
+                      "example_files/missing_file.sl2", 
+                      "example_files/example_sl3_file.sl3"]
+
+    def test_load_many(self):
+        results = load_many(self.paths, workers=2)
+        self.assertEqual([r.path for r in results], self.paths)
+
+        #Failing files are reported without stopping the batch
+        self.assertIsNone(results[1].sonar)
+        self.assertIsInstance(results[1].error, FileNotFoundError)
+
+        for result in [results[0], results[2]]:
+            self.assertIsNone(result.error)
+            sonar = Sonar(result.path)
+            self.assertEqual(result.sonar.df.shape, sonar.df.shape)
+            for channel in sonar.valid_channels:
+                np.testing.assert_array_equal(result.sonar.image(channel), sonar.image(channel))
+
+    def test_load_many_without_sharing(self):
+        results = load_many(self.paths[:1], workers=1, share_echoes=False, augment_coords=True)
+        self.assertIn("x_augmented", results[0].sonar.df.columns)
+        self.assertEqual(results[0].sonar.image("primary").shape[0], results[0].sonar.df.query("survey == 'primary'").shape[0])
@@ -0,0 +1,36 @@
+import unittest
+import subprocess
+import sys
+from sonarlight import Sonar, probe
+import numpy as np
+
+class TestProbe(unittest.TestCase):
+    def setUp(self):
+        self.paths = ["example_files/example_sl2_file.sl2", "example_files/example_sl3_file.sl3"]
+
+    def test_probe(self):
+        #Does the summary from sampled frame headers match the decoded file?
+        for path in self.paths:
+            summary = probe(path)
+            sonar = Sonar(path, clean=False)
+            df = sonar.df[sonar.df["x"] != 0]
+
+            self.assertEqual((summary.version, summary.device_id, summary.blocksize), (sonar.version, sonar.device_id, sonar.blocksize))
+            self.assertEqual(summary.channels, sonar.valid_channels)
+            self.assertLessEqual(abs(summary.frames - sonar.df.shape[0]), 0.01 * sonar.df.shape[0])
+            self.assertEqual(summary.start_time, np.datetime64(sonar.df["datetime"].iloc[0], "ms"))
+            self.assertLessEqual(abs(summary.end_time - np.datetime64(sonar.df["datetime"].iloc[-1], "ms")), np.timedelta64(1, "s"))
+
+            lon_min, lat_min, lon_max, lat_max = summary.bbox
+            self.assertGreaterEqual(lon_min, df["longitude"].min())
+            self.assertLessEqual(lat_max, df["latitude"].max())
+            self.assertAlmostEqual(lon_max, df["longitude"].max(), places=3)
+
+    def test_import_without_pandas(self):
+        #Is pandas only imported when a class depending on it is used?
+        code = ("import sys, sonarlight; sonarlight.probe('example_files/example_sl2_file.sl2'); "
+                "assert 'pandas' not in sys.modules; sonarlight.Sonar; assert 'pandas' in sys.modules")
+        subprocess.run([sys.executable, "-c", code], check=True)
+
+if __name__ == '__main__':
+    unittest.main()
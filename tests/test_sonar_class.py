@@ -1,7 +1,68 @@
 import unittest
 from sonarlight import Sonar
+from sonarlight.echo_store import EchoStore, _gather_pings
 import pandas as pd
 import numpy as np
+import math
+import os
+import tempfile
+import shutil
+import importlib.util
+import tracemalloc
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+def legacy_coordinate_augmentation(df):
+    #Original frame by frame implementation of the coordinate augmentation, used as reference
+    df = df.reset_index(drop=True)
+    df['longitude_augmented'] = df['longitude']
+    df['latitude_augmented'] = df['latitude']
+
+    longitude0 = df.loc[0, 'longitude']
+    latitude0 = df.loc[0, 'latitude']
+    v0 = df.loc[0, 'gps_speed']
+    t0 = df.loc[0, 'seconds']
+    d0 = math.tau - df.loc[0, 'gps_heading'] + (math.pi / 2)
+    lim = 1.2
+
+    for i in range(1, len(df)):
+        t1 = df.loc[i, 'seconds']
+        v1 = df.loc[i, 'gps_speed']
+        d1 = math.tau - df.loc[i, 'gps_heading'] + (math.pi / 2)
+
+        dt = t1 - t0
+        v_longitude0 = math.cos(d0) * v0
+        v_latitude0 = math.sin(d0) * v0
+        v_longitude1 = math.cos(d1) * v1
+        v_latitude1 = math.sin(d1) * v1
+
+        latitude0 += dt * 0.5 * (v_latitude0 + v_latitude1) * 180 / (math.pi * 6356752.3142)
+        longitude0 += dt * 0.5 * (v_longitude0 + v_longitude1) * 180 / (math.pi * math.cos(math.radians(latitude0)) * 6356752.3142)
+
+        d0, t0, v0 = d1, t1, v1
+
+        lat_dist = math.radians(abs(df.loc[i, 'latitude'] - latitude0)) * 6356752.3142
+        if df.loc[i, 'survey_type'] in [0, 1]:
+            if lat_dist > lim:
+                latitude0 = df.loc[i, 'latitude'] + math.copysign(math.degrees(lim / 6356752.3142), latitude0 - df.loc[i, 'latitude'])
+
+            lon_dist = math.radians(abs(df.loc[i, 'longitude'] - longitude0)) * (6356752.3142 * math.cos(math.radians(latitude0)))
+            if lon_dist > lim:
+                longitude0 = df.loc[i, 'longitude'] + math.copysign(math.degrees(lim / (6356752.3142 * math.cos(math.radians(latitude0)))), longitude0 - df.loc[i, 'longitude'])
+        else:
+            if lat_dist > 50:
+                latitude0 = df.loc[i, 'latitude']
+
+            lon_dist = math.radians(abs(df.loc[i, 'longitude'] - longitude0)) * (6356752.3142 * math.cos(math.radians(latitude0)))
+            if lon_dist > 50:
+                longitude0 = df.loc[i, 'longitude']
+
+        df.loc[i, 'longitude_augmented'] = longitude0
+        df.loc[i, 'latitude_augmented'] = latitude0
+        df.loc[i, 'x_augmented'] = longitude0 * (math.pi / 180) * 6356752.3142
+        df.loc[i, 'y_augmented'] = math.log(math.tan((latitude0 * (math.pi / 180) + (math.pi / 2)) / 2)) * 6356752.3142
+
+    return(df)
 
 class TestSonarClass(unittest.TestCase):
     def setUp(self):
@@ -97,6 +158,58 @@ class TestSonarClass(unittest.TestCase):
     def test_sl3_xyz(self):
         self.assertIsInstance(self.sl3.sidescan_xyz(), pd.DataFrame)
 
+    def test_iter_sidescan_xyz(self):
+        #Do the chunks add up to the full XYZ point cloud?
+        xyz = self.sl3_augment.sidescan_xyz()
+
+        chunks = list(self.sl3_augment.iter_sidescan_xyz(chunk_pings=100, dtype=np.float64, lonlat=True))
+        self.assertGreater(len(chunks), 1)
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), xyz)
+
+        chunk = next(self.sl3_augment.iter_sidescan_xyz(chunk_pings=100))
+        self.assertEqual(list(chunk.columns), ["x", "y", "z"])
+        self.assertEqual(chunk["x"].dtype, np.float32)
+
+    def test_sidescan_mosaic(self):
+        xyz = self.sl2.sidescan_xyz()
+        
+        count, geotransform = self.sl2.sidescan_mosaic(resolution=2, agg="count", chunk_pings=100)
+        self.assertEqual(count.sum(), xyz.shape[0])
+        self.assertAlmostEqual(geotransform[0], xyz["x"].min())
+        self.assertAlmostEqual(geotransform[3], xyz["y"].max())
+
+        mean, _ = self.sl2.sidescan_mosaic(resolution=2, agg="mean")
+        maximum, _ = self.sl2.sidescan_mosaic(resolution=2, agg="max")
+        self.assertEqual(mean.shape, count.shape)
+        self.assertTrue(np.isnan(mean[count == 0]).all())
+        self.assertAlmostEqual(np.nansum(mean * count), xyz["z"].astype("float64").sum(), places=3)
+        self.assertEqual(np.nanmax(maximum), xyz["z"].max())
+
+        with self.assertRaises(ValueError):
+            self.sl2.sidescan_mosaic(agg="typo")
+        for resolution in [0, -1]:
+            with self.assertRaises(ValueError):
+                self.sl2.sidescan_mosaic(resolution=resolution)
+
+    def test_sidescan_mosaic_missing_coordinates(self):
+        #Are pixels of a sidescan ping without coordinates left out of the grid and its extent?
+        sonar = self.sl2_augment
+        first_sidescan = sonar.df.index[sonar.df["survey"] == "sidescan"][0]
+        reference = Sonar(sonar.path, augment_coords=True)
+        reference.df = reference.df.drop(index=first_sidescan)
+
+        sonar.df.loc[first_sidescan, ["x_augmented", "y_augmented"]] = np.nan
+        xyz = reference.sidescan_xyz()
+
+        for resolution in [0.7, 1.0, 1.3]:
+            with np.errstate(invalid="raise"):
+                count, geotransform = sonar.sidescan_mosaic(resolution=resolution, agg="count")
+            expected, expected_geotransform = reference.sidescan_mosaic(resolution=resolution, agg="count")
+            np.testing.assert_array_equal(count, expected)
+            self.assertEqual(geotransform, expected_geotransform)
+            self.assertEqual(count.sum(), xyz.shape[0])
+            self.assertEqual(count[0, 0], expected[0, 0])
+
     def test_sl2_water(self):
 
         pixels=300
@@ -174,3 +287,445 @@ class TestSonarClass(unittest.TestCase):
 
         bottom_downscan = self.sl3.bottom("downscan")
         self.assertIsInstance(bottom_downscan, np.ndarray)
+
+    def test_water_bottom(self):
+        #Do the batched water and bottom extractions match the original ping by ping implementation?
+        data = self.sl3.df.query("survey == 'primary'")
+        pings = [self.sl3.echoes["primary"][i] for i in range(data.shape[0])]
+        bottom_index = data["bottom_index"].to_numpy()
+
+        water = np.stack([np.interp(np.linspace(0, d, 300), np.linspace(0, d, b), p[:b]) for p, b, d in zip(pings, bottom_index, data["water_depth"])])
+        np.testing.assert_allclose(self.sl3.water("primary", 300), water, rtol=1e-12, atol=1e-9)
+
+        bottom = [p[b:] for p, b in zip(pings, bottom_index)]
+        min_len = min(len(p) for p in bottom)
+        np.testing.assert_array_equal(self.sl3.bottom("primary"), np.stack([p[:min_len] for p in bottom]))
+
+        bottom_pad = self.sl3.bottom("primary", mode="pad")
+        self.assertEqual(bottom_pad.dtype, np.float64)
+        self.assertEqual(bottom_pad.shape[1], max(len(p) for p in bottom))
+        for i in [0, len(bottom) // 2, len(bottom) - 1]:
+            np.testing.assert_array_equal(bottom_pad[i, :len(bottom[i])], bottom[i])
+            self.assertTrue(np.isnan(bottom_pad[i, len(bottom[i]):]).all())
+
+        self.assertEqual(self.sl3.bottom("primary", mode="pad", fill_value=0).dtype, np.uint8)
+        bottom_pad = self.sl3.bottom("primary", mode="pad", fill_value=-1)
+        self.assertEqual(bottom_pad.dtype, np.int16)
+        for i in [0, len(bottom) - 1]:
+            np.testing.assert_array_equal(bottom_pad[i, :len(bottom[i])], bottom[i])
+            self.assertTrue((bottom_pad[i, len(bottom[i]):] == -1).all())
+
+        with self.assertRaises(ValueError):
+            self.sl3.bottom("primary", mode="typo")
+
+    def test_profile(self):
+        #Are the stages of reading a file recorded and logged when profiling?
+        with self.assertLogs("sonarlight", level="INFO") as logs:
+            sonar = Sonar(self.sl2.path, augment_coords=True, profile=True)
+
+        stages = ["read_bin", "decode", "process", "coordinate_augmentation", "clean", "store_echoes", "total"]
+        self.assertEqual(list(sonar.stats), stages)
+        self.assertEqual(len(logs.records), len(stages))
+        self.assertEqual(logs.records[1].sonarlight_stats, sonar.stats["decode"])
+        self.assertEqual(sonar.stats["read_bin"]["bytes_read"], os.path.getsize(self.sl2.path))
+        self.assertEqual(sonar.stats["total"]["frames"], sonar.df.shape[0])
+        self.assertGreater(sonar.stats["read_bin"]["peak_bytes"], 0)
+        self.assertEqual(self.sl2.stats, {})
+
+        #Tracing started by the caller keeps running with its peak untouched
+        tracemalloc.start()
+        try:
+            np.ones(2**26, dtype="uint8")
+            Sonar(self.sl2.path, profile=True)
+            self.assertTrue(tracemalloc.is_tracing())
+            self.assertGreaterEqual(tracemalloc.get_traced_memory()[1], 2**26)
+        finally:
+            tracemalloc.stop()
+
+    def test_compact(self):
+        #Does the compact dataframe hold the named fields only, with the raw headers available?
+        full = Sonar(self.sl3.path, clean=False)
+        compact = Sonar(self.sl3.path, clean=False, compact=True)
+
+        self.assertFalse([i for i in compact.df.columns if i.startswith("unknown")])
+        pd.testing.assert_frame_equal(compact.df, full.df[compact.df.columns])
+        self.assertLess(compact.df.memory_usage().sum(), full.df.memory_usage().sum())
+
+        headers = compact.headers
+        self.assertEqual(headers.dtype, compact.frame_dtype)
+        np.testing.assert_array_equal(headers["unknown28"], full.df["unknown28"].to_numpy())
+
+        #Unknown fields are added when selected
+        selected = Sonar(self.sl3.path, compact=True, columns=["water_depth", "unknown28"])
+        self.assertEqual(list(selected.df.columns), ["survey", "water_depth", "unknown28"])
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            Sonar(self.sl3.path, cache_dir=cache_dir)
+            with self.assertRaises(ValueError):
+                Sonar(self.sl3.path, cache_dir=cache_dir).headers
+
+    def test_async_extraction(self):
+        #Do concurrent asynchronous calls give the same results as the synchronous methods?
+        sonar = Sonar(self.sl2.path, mmap=True)
+        sonar.executor = ThreadPoolExecutor(4)
+
+        async def extract():
+            return(await asyncio.gather(*[sonar.aimage(channel) for channel in sonar.valid_channels * 2],
+                                        sonar.awater("primary", 100), sonar.awater("primary", 100), sonar.asidescan_xyz()))
+
+        results = asyncio.run(extract())
+        sonar.executor.shutdown()
+        sonar.executor = None
+
+        for image, channel in zip(results, self.sl2.valid_channels * 2):
+            np.testing.assert_array_equal(image, self.sl2.image(channel))
+        np.testing.assert_array_equal(results[-2], self.sl2.water("primary", 100))
+        pd.testing.assert_frame_equal(results[-1], self.sl2.sidescan_xyz())
+
+        #Cached results are shared and read-only, and are dropped when the dataframe is replaced
+        water = asyncio.run(sonar.awater("primary", 100))
+        self.assertIs(asyncio.run(sonar.awater("primary", 100)), water)
+        self.assertFalse(water.flags.writeable)
+        self.assertGreater(sonar.result_cache.hits, 0)
+        sonar.df = sonar.df[sonar.df["water_depth"] > 5]
+        self.assertEqual(asyncio.run(sonar.aimage("primary")).shape[0], (sonar.df["survey"] == "primary").sum())
+
+        #Images viewing the stored pixels are not charged, as evicting them frees no memory
+        sonar = Sonar(self.sl2.path, mmap=True)
+        sonar._extract("image", "primary")
+        sonar._extract("bottom", "primary")
+        self.assertEqual(sonar.result_cache.nbytes, sonar.bottom("primary").nbytes)
+
+        #Least recently used results are removed to stay within the memory budget
+        sonar.result_cache.max_bytes = results[-2].nbytes
+        sonar._extract("water", "primary", 100)
+        sonar._extract("water", "primary", 50)
+        self.assertEqual(len(sonar.result_cache), 1)
+        self.assertLessEqual(sonar.result_cache.nbytes, sonar.result_cache.max_bytes)
+
+        #Images copied from the stored pixels of a filtered dataframe are charged, also when read-only
+        sonar = Sonar(self.sl2.path)
+        sonar.df = sonar.df[sonar.df["water_depth"] > 5]
+        sonar.result_cache.max_bytes = 10
+        for channel in sonar.valid_channels:
+            image = sonar._extract("image", channel)
+            self.assertFalse(np.shares_memory(image, sonar.echoes[channel].values))
+        self.assertEqual(len(sonar.result_cache), 0)
+        self.assertEqual(sonar.result_cache.nbytes, 0)
+        sonar.result_cache.max_bytes = 2**29
+        images = [sonar._extract("image", channel) for channel in sonar.valid_channels]
+        self.assertEqual(sonar.result_cache.nbytes, sum(image.nbytes for image in images))
+
+    def test_image_pyramid(self):
+        #Are the levels pooled over blocks of pixels, leaving out pixels beyond the end of the image?
+        image = self.sl2.image("sidescan").astype("float64")
+        mean_pyramid = self.sl2.image_pyramid("sidescan", levels=3, agg="mean")
+        max_pyramid = self.sl2.image_pyramid("sidescan", levels=3, agg="max")
+
+        for k, (level_mean, level_max) in enumerate(zip(mean_pyramid, max_pyramid), start=1):
+            block = 2**k
+            self.assertEqual(level_mean.shape, (math.ceil(image.shape[0] / block), math.ceil(image.shape[1] / block)))
+            self.assertAlmostEqual(level_mean[-1, 5], image[((level_mean.shape[0] - 1) * block):, (5 * block):(6 * block)].mean(), places=4)
+            self.assertEqual(level_max[3, 7], image[(3 * block):(4 * block), (7 * block):(8 * block)].max())
+
+        whole_blocks = image[:(image.shape[0] // 2 * 2)]
+        np.testing.assert_allclose(mean_pyramid[0][:(image.shape[0] // 2)], whole_blocks.reshape(-1, 2, image.shape[1] // 2, 2).mean(axis=(1, 3)), rtol=1e-6)
+
+        with tempfile.TemporaryDirectory() as pyramid_dir:
+            saved = self.sl2.image_pyramid("sidescan", levels=2, agg="max", path=pyramid_dir)
+            np.testing.assert_array_equal(np.load(os.path.join(pyramid_dir, "level_2.npy")), max_pyramid[1])
+            del saved
+
+        with self.assertRaises(ValueError):
+            self.sl2.image_pyramid("sidescan", agg="median")
+
+    def test_detect_bottom(self):
+        #Is a known bottom found in noisy pings?
+        echoes = self.sl2.echoes["primary"]
+        n_pings, ping_len = echoes.matrix.shape
+        true_bottom = (200 + 100*np.sin(np.arange(n_pings) / 50)).astype("int32")
+        rng = np.random.default_rng(0)
+        pings = rng.integers(0, 40, size=(n_pings, ping_len)).astype("uint8")
+        pings[np.arange(ping_len) >= true_bottom[:, None]] += 150
+        self.sl2.echoes["primary"] = EchoStore(pings.ravel(), echoes.offsets, echoes.index)
+
+        for method in ["threshold", "gradient"]:
+            bottom_index = self.sl2.detect_bottom("primary", method=method)
+            self.assertEqual(bottom_index.shape, (n_pings,))
+            self.assertLessEqual(np.abs(bottom_index - true_bottom).max(), 1)
+
+        np.testing.assert_array_equal(self.sl2.bottom_intensity("primary", bottom_index=true_bottom), pings[np.arange(n_pings), true_bottom])
+        self.assertEqual(self.sl2.bottom("primary", bottom_index=true_bottom).shape[1], ping_len - true_bottom.max())
+        self.assertEqual(self.sl2.water("primary", 100, bottom_index=true_bottom).shape, (n_pings, 100))
+
+        window_stats = self.sl2.bottom_window_stats("primary", above=2, below=3, bottom_index=true_bottom)
+        window = pings[np.arange(n_pings)[:, None], true_bottom[:, None] + np.arange(-2, 4)]
+        np.testing.assert_allclose(window_stats["mean"], window.mean(axis=1))
+        np.testing.assert_allclose(window_stats["std"], window.std(axis=1))
+        np.testing.assert_array_equal(window_stats["max"], window.max(axis=1))
+        np.testing.assert_array_equal(window_stats.index, echoes.index)
+
+        with self.assertRaises(ValueError):
+            self.sl2.bottom_intensity("primary", bottom_index=true_bottom[1:])
+
+        with self.assertRaises(ValueError):
+            self.sl2.detect_bottom("primary", method="typo")
+
+    def test_mmap(self):
+        #Does memory-mapped reading give the same data as reading the file into memory?
+        sl2_mmap = Sonar("example_files/example_sl2_file.sl2", mmap=True)
+        sl3_mmap = Sonar("example_files/example_sl3_file.sl3", mmap=True)
+
+        self.assertEqual(sl2_mmap.df.shape, self.sl2.df.shape)
+        self.assertEqual(sl3_mmap.df.shape, self.sl3.df.shape)
+
+        for channel in self.sl2.valid_channels:
+            np.testing.assert_array_equal(sl2_mmap.image(channel), self.sl2.image(channel))
+
+        for channel in self.sl3.valid_channels:
+            np.testing.assert_array_equal(sl3_mmap.image(channel), self.sl3.image(channel))
+
+    def test_echo_memory(self):
+        #Are pings gathered without a temporary copy of all pings, and viewed without copying when evenly spaced?
+        rng = np.random.default_rng(0)
+        data = rng.integers(0, 255, size=2**25, dtype="uint8")
+        lengths = np.full(8000, 2800)
+        starts = np.cumsum(rng.integers(2800, 4000, size=8000)) - 2800
+
+        tracemalloc.start()
+        values = _gather_pings(data, starts, lengths)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(peak, 1.25 * values.nbytes)
+        np.testing.assert_array_equal(values[(2800*5):(2800*6)], data[starts[5]:(starts[5] + 2800)])
+
+        #Pings of unequal lengths are gathered with bounded index arrays
+        lengths = rng.integers(2000, 3073, size=7000)
+        starts = np.cumsum(rng.integers(3072, 4000, size=7000)) - 3072
+        ends = np.cumsum(lengths)
+
+        tracemalloc.start()
+        values = _gather_pings(data, starts, lengths)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(peak, 1.3 * values.nbytes)
+        for i in [0, 5, 6999]:
+            np.testing.assert_array_equal(values[(ends[i] - lengths[i]):ends[i]], data[starts[i]:(starts[i] + lengths[i])])
+
+        sl2_mmap = Sonar("example_files/example_sl2_file.sl2", mmap=True)
+        sidescan = sl2_mmap.image("sidescan")
+        self.assertTrue(np.shares_memory(sidescan, sl2_mmap.buffer))
+        self.assertFalse(sidescan.flags.writeable)
+        np.testing.assert_array_equal(sidescan, self.sl2.image("sidescan"))
+
+        #Chunked passes over a mapped file copy one chunk of pixels at a time instead of the whole channel
+        sl2_mmap = Sonar("example_files/example_sl2_file.sl2", mmap=True)
+        channel_bytes = sl2_mmap.echoes["sidescan"].offsets[-1]
+        tracemalloc.start()
+        mosaic, _ = sl2_mmap.sidescan_mosaic(resolution=5, chunk_pings=10)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(peak, channel_bytes)
+        np.testing.assert_array_equal(mosaic, self.sl2.sidescan_mosaic(resolution=5)[0])
+
+        next(sl2_mmap.iter_sidescan_xyz(chunk_pings=10))
+        sl2_mmap.image_pyramid("sidescan", levels=2)
+        sl2_mmap.detect_bottom("primary")
+        sl2_mmap.df = sl2_mmap.df[sl2_mmap.df["water_depth"] > 5]
+        sl2_mmap.sidescan_mosaic(resolution=5, chunk_pings=10)
+        self.assertTrue(all(echoes._values is None for echoes in sl2_mmap.echoes.values()))
+
+    def test_frame_offsets(self):
+        #Do the frame offsets found when decoding follow the chain of frame sizes?
+        for path in ["example_files/example_sl2_file.sl2", "example_files/example_sl3_file.sl3"]:
+            sonar = Sonar(path, clean=False)
+            offsets = sonar.df["first_byte_no_offset"].to_numpy()
+            self.assertEqual(offsets[0], 0)
+            np.testing.assert_array_equal(offsets[1:], offsets[:-1] + sonar.df["frame_size"].to_numpy()[:-1])
+
+    def test_echoes(self):
+        #Are pixels stored contiguously for each channel and matched to the rows of the dataframe?
+        for sonar in [self.sl2, self.sl3]:
+            self.assertNotIn("frames", sonar.df.columns)
+
+            for channel in sonar.valid_channels:
+                echoes = sonar.echoes[channel]
+                channel_index = sonar.df.index[sonar.df["survey"] == channel]
+                np.testing.assert_array_equal(echoes.index, channel_index)
+                self.assertEqual(echoes.values.ndim, 1)
+                self.assertEqual(echoes.offsets[-1], len(echoes.values))
+                self.assertIs(sonar.image(channel).base, echoes.values)
+
+        #Extraction follows rows removed from the dataframe
+        primary = self.sl2.image("primary")
+        self.sl2.df = self.sl2.df.iloc[::2]
+        primary_subset = self.sl2.image("primary")
+        self.assertEqual(primary_subset.shape[0], self.sl2.df.query("survey == 'primary'").shape[0])
+        np.testing.assert_array_equal(primary_subset, primary[np.isin(self.sl2.echoes["primary"].index, self.sl2.df.index)])
+
+    def test_channel_rows(self):
+        #Are the rows of each channel found from the categorical survey column?
+        for sonar in [self.sl2, self.sl3]:
+            self.assertIsInstance(sonar.df["survey"].dtype, pd.CategoricalDtype)
+            for channel in sonar.valid_channels:
+                np.testing.assert_array_equal(sonar._channel_rows(channel), np.flatnonzero(sonar.df["survey"] == channel))
+
+        unclean = Sonar(self.sl2.path, clean=False)
+        self.assertIsInstance(unclean.df["frequency"].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(unclean.df["survey"].cat.categories), list(self.sl3.df["survey"].cat.categories))
+
+        #Rows are grouped again when the dataframe is replaced
+        self.sl3.df = self.sl3.df[self.sl3.df["survey"] != "primary"]
+        self.assertEqual(len(self.sl3._channel_rows("primary")), 0)
+        np.testing.assert_array_equal(self.sl3._channel_rows("sidescan"), np.flatnonzero(self.sl3.df["survey"] == "sidescan"))
+
+    def test_iter_chunks(self):
+        #Does reading in chunks give the same data as reading the whole file?
+        for sonar in [self.sl2, self.sl3]:
+            chunks = list(Sonar.iter_chunks(sonar.path, frames_per_chunk=1000))
+            self.assertGreater(len(chunks), 1)
+            pd.testing.assert_frame_equal(pd.concat([c.df for c in chunks]), sonar.df)
+
+            sidescan = np.concatenate([c.image("sidescan") for c in Sonar.iter_chunks(sonar.path, frames_per_chunk=1000, channels=["sidescan"])])
+            np.testing.assert_array_equal(sidescan, sonar.image("sidescan"))
+
+        with self.assertRaises(ValueError):
+            next(Sonar.iter_chunks(self.sl2.path, channels=["typo"]))
+
+    def test_follow(self):
+        #Does following a file while it is written give the same data as reading the finished file?
+        with open(self.sl2.path, "rb") as f:
+            data = f.read()
+
+        with tempfile.TemporaryDirectory() as follow_dir:
+            path = os.path.join(follow_dir, "sl2.sl2")
+
+            #The file is cut in the middle of a frame
+            with open(path, "wb") as f:
+                f.write(data[:len(data) // 3])
+
+            follow = Sonar.follow(path, poll_interval=0.01, timeout=0.1)
+            chunks = [next(follow)]
+
+            with open(path, "ab") as f:
+                f.write(data[len(data) // 3:])
+
+            chunks.extend(follow)
+            self.assertGreater(len(chunks), 1)
+            pd.testing.assert_frame_equal(pd.concat([c.df for c in chunks]), self.sl2.df)
+            np.testing.assert_array_equal(np.concatenate([c.image("primary") for c in chunks]), self.sl2.image("primary"))
+
+            #Only frames appended after starting to follow are yielded
+            self.assertEqual(list(Sonar.follow(path, poll_interval=0.01, timeout=0.1, from_start=False)), [])
+
+    def test_coordinate_augmentation(self):
+        #Does the vectorized coordinate augmentation match the original frame by frame implementation?
+        columns = ["longitude_augmented", "latitude_augmented", "x_augmented", "y_augmented"]
+
+        for path in ["example_files/example_sl2_file.sl2", "example_files/example_sl3_file.sl3"]:
+            sonar = Sonar(path, clean=False, augment_coords=True)
+            reference = legacy_coordinate_augmentation(sonar.df.iloc[:1000].drop(columns=columns))
+            np.testing.assert_allclose(sonar.df[columns].iloc[:1000].to_numpy(), reference[columns].to_numpy(), rtol=1e-12)
+
+    def test_select_channels_and_columns(self):
+        #Are only the requested channels and columns decoded?
+        sidescan = Sonar("example_files/example_sl2_file.sl2", channels=["sidescan"])
+        self.assertEqual(sidescan.valid_channels, ["sidescan"])
+        pd.testing.assert_frame_equal(sidescan.df, self.sl2.df.query("survey == 'sidescan'"))
+        np.testing.assert_array_equal(sidescan.image("sidescan"), self.sl2.image("sidescan"))
+
+        primary_augment = Sonar("example_files/example_sl3_file.sl3", channels=["primary"], augment_coords=True)
+        pd.testing.assert_frame_equal(primary_augment.df, self.sl3_augment.df.query("survey == 'primary'"))
+
+        navigation = Sonar("example_files/example_sl2_file.sl2", columns=["x", "y", "water_depth"], load_echoes=False)
+        self.assertEqual(list(navigation.df.columns), ["survey", "x", "y", "water_depth"])
+        self.assertEqual(navigation.df.shape[0], self.sl2.df.shape[0])
+        self.assertEqual(navigation.echoes, {})
+
+        with self.assertRaises(ValueError):
+            navigation.image("primary")
+
+        with self.assertRaises(ValueError):
+            Sonar("example_files/example_sl2_file.sl2", channels=["typo"])
+
+    def test_cache(self):
+        #Does a file loaded from the cache match the decoded file?
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for sonar in [self.sl2, self.sl3_augment]:
+                first = Sonar(sonar.path, augment_coords=sonar.augment_coords, cache_dir=cache_dir)
+                cached = Sonar(sonar.path, augment_coords=sonar.augment_coords, cache_dir=cache_dir)
+
+                pd.testing.assert_frame_equal(cached.df, sonar.df)
+                self.assertEqual(repr(cached), repr(sonar))
+                for channel in sonar.valid_channels:
+                    self.assertIsInstance(cached.echoes[channel].values, np.memmap)
+                    np.testing.assert_array_equal(cached.image(channel), sonar.image(channel))
+
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            #Least recently used entries are removed when the cache grows too large
+            Sonar(self.sl2.path, channels=["primary"], cache_dir=cache_dir, cache_size=0)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_frame_index(self):
+        #Does reading from the frame index give the same frames as filtering the decoded file?
+        with tempfile.TemporaryDirectory() as index_dir:
+            path = os.path.join(index_dir, "sl3.sl3")
+            shutil.copy(self.sl3.path, path)
+
+            index = Sonar.open_index(path)
+            self.assertTrue(os.path.exists(path + ".index.npz"))
+            self.assertEqual(len(index), Sonar(path, clean=False).df.shape[0])
+            np.testing.assert_array_equal(Sonar.open_index(path).frames, index.frames)
+
+            df = self.sl3.df
+            time_range = (df["datetime"].iloc[500], df["datetime"].iloc[1500])
+            sidescan = index.read(time_range=time_range, channel="sidescan")
+            expected = df[(df["datetime"] >= time_range[0]) & (df["datetime"] <= time_range[1]) & (df["survey"] == "sidescan")]
+            pd.testing.assert_frame_equal(sidescan.df, expected)
+            np.testing.assert_array_equal(sidescan.image("sidescan"), self.sl3.image("sidescan")[np.isin(self.sl3.echoes["sidescan"].index, expected.index)])
+
+            bbox = (df["longitude"].quantile(0.25), df["latitude"].quantile(0.25), df["longitude"].quantile(0.75), df["latitude"].quantile(0.75))
+            area = index.read(bbox=bbox, load_echoes=False)
+            expected = df[df["longitude"].between(bbox[0], bbox[2]) & df["latitude"].between(bbox[1], bbox[3])]
+            pd.testing.assert_frame_equal(area.df, expected)
+
+    def test_export_npz(self):
+        #Does a file loaded from a '.npz' export match the decoded file?
+        with tempfile.TemporaryDirectory() as export_dir:
+            path = os.path.join(export_dir, "sl3.npz")
+            self.sl3_augment.to_npz(path)
+            exported = Sonar.from_export(path)
+
+            pd.testing.assert_frame_equal(exported.df, self.sl3_augment.df)
+            self.assertEqual(repr(exported), repr(self.sl3_augment))
+            for channel in self.sl3_augment.valid_channels:
+                np.testing.assert_array_equal(exported.image(channel), self.sl3_augment.image(channel))
+
+            navigation = Sonar.from_export(path, columns=["x", "y"], load_echoes=False)
+            self.assertEqual(list(navigation.df.columns), ["survey", "x", "y"])
+            self.assertEqual(navigation.echoes, {})
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow not installed")
+    def test_export_parquet(self):
+        #Does a file loaded from a Parquet export match the decoded file?
+        with tempfile.TemporaryDirectory() as export_dir:
+            path = os.path.join(export_dir, "sl3.parquet")
+            self.sl3.to_parquet(path, row_group_size=1000)
+            exported = Sonar.from_export(path)
+
+            pd.testing.assert_frame_equal(exported.df, self.sl3.df)
+            for channel in self.sl3.valid_channels:
+                np.testing.assert_array_equal(exported.image(channel), self.sl3.image(channel))
+
+            sidescan = Sonar.from_export(path, columns=["x", "y"], filters=[("survey", "==", "sidescan")])
+            pd.testing.assert_frame_equal(sidescan.df, self.sl3.df.query("survey == 'sidescan'")[["survey", "x", "y"]])
+            np.testing.assert_array_equal(sidescan.image("sidescan"), self.sl3.image("sidescan"))
+            self.assertEqual(sidescan.valid_channels, ["sidescan"])
+            self.assertEqual(sidescan.valid_channels_records, [sidescan.df.shape[0]])
+            self.assertEqual(list(sidescan.echoes), ["sidescan"])
+            self.assertNotIn("Primary", repr(sidescan))
+            with self.assertRaises(ValueError):
+                sidescan.image("primary")
+
+            self.assertEqual(self.sl3.to_arrow().num_rows, self.sl3.df.shape[0])
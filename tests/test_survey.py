@@ -0,0 +1,70 @@
+import unittest
+from sonarlight import Sonar, Survey
+from sonarlight.sonar_class import sl2_frame_dtype, _frame_offsets
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+
+def split_file(path, first_frame, last_frame, new_path):
+    #Write frames first_frame to last_frame of a '.sl2' file to a new file, as if recorded as a separate log
+    with open(path, "rb") as f:
+        data = np.frombuffer(f.read(), dtype="uint8")
+    offsets = _frame_offsets(data[8:], sl2_frame_dtype.itemsize, sl2_frame_dtype.fields["frame_size"][1])
+    offsets = np.append(offsets, len(data) - 8)
+
+    #The last frame is only read if followed by more data, and the "first_byte" field is the position in the new file
+    last_frame = min(last_frame + 1, len(offsets) - 1)
+    frames = data[(8 + offsets[first_frame]):(8 + offsets[last_frame])].copy()
+    first_byte = np.add.outer(offsets[first_frame:last_frame] - offsets[first_frame], np.arange(4))
+    frames[first_byte] = (frames[first_byte].view("<u4").ravel() - offsets[first_frame]).astype("<u4").view("uint8").reshape(-1, 4)
+
+    with open(new_path, "wb") as f:
+        f.write(data[:8].tobytes() + frames.tobytes())
+
+class TestSurvey(unittest.TestCase):
+    def setUp(self):
+        self.path = "example_files/example_sl2_file.sl2"
+        self.sl2 = Sonar(self.path)
+        self.survey_dir = tempfile.TemporaryDirectory()
+        self.paths = [os.path.join(self.survey_dir.name, "part2.sl2"), os.path.join(self.survey_dir.name, "part1.sl2")]
+
+        #Two logs overlapping by 1000 frames, given out of order
+        split_file(self.path, 2000, 5200, self.paths[0])
+        split_file(self.path, 0, 3000, self.paths[1])
+        self.survey = Survey(self.paths)
+
+    def tearDown(self):
+        self.survey_dir.cleanup()
+
+    def test_survey(self):
+        #Do the merged logs give the same frames as the original file?
+        self.assertEqual(len(self.survey), Sonar(self.path, clean=False).df.shape[0])
+        self.assertTrue((np.diff(self.survey.frames["time"]) >= 0).all())
+
+        merged = self.survey.read()
+        pd.testing.assert_frame_equal(merged.df.reset_index(drop=True), self.sl2.df.reset_index(drop=True))
+        self.assertEqual(merged.valid_channels, self.sl2.valid_channels)
+
+        for channel in self.sl2.valid_channels:
+            np.testing.assert_array_equal(self.survey.image(channel), self.sl2.image(channel))
+        np.testing.assert_array_equal(self.survey.water("primary", 100), self.sl2.water("primary", 100))
+        np.testing.assert_array_equal(self.survey.bottom("downscan"), self.sl2.bottom("downscan"))
+        pd.testing.assert_frame_equal(self.survey.sidescan_xyz(), self.sl2.sidescan_xyz())
+
+    def test_survey_select(self):
+        #Are only frames of the time window read, also from a single log?
+        df = self.sl2.df
+        time_range = (df["datetime"].iloc[100], df["datetime"].iloc[200])
+        window = self.survey.read(time_range=time_range, channel="sidescan")
+        expected = df[(df["datetime"] >= time_range[0]) & (df["datetime"] <= time_range[1]) & (df["survey"] == "sidescan")]
+        pd.testing.assert_frame_equal(window.df.reset_index(drop=True), expected.reset_index(drop=True))
+        self.assertEqual(window.image("sidescan").shape[0], expected.shape[0])
+
+        self.assertEqual(self.survey.read(time_range=("2000-01-01", "2000-01-02")).df.shape[0], 0)
+
+        with self.assertRaises(ValueError):
+            Survey([])
+
+if __name__ == '__main__':
+    unittest.main()